@@ -1,6 +1,11 @@
 
 import numpy as np
 
+# The rollouts per expanded leaf of the engines in the Minimal experiments.
+# With more than one, the payoffs of a leaf are drawn in one block by
+# `Minimal.random_playouts`, 1 plays a single game per leaf.
+rollouts = 1
+
 parameters = {
     10: {
         "exploration": 10.0,
@@ -1,58 +1,47 @@
 #!/usr/bin/env python
 
-from functools import reduce
-from operator import add
 import sys
 
-from cbt.game import Game
+from cbt.algorithms.solver import Solver
 import cbt.games.tictactoe as ttt
 
-def main(size: int = 3) -> int:
-    game = ttt.TicTacToe(size = size)
+def main(size: int = 3, k: int | None = None, path: str | None = None) -> int:
+    """
+    Print the minimax and random-play values after the first two moves.
+
+    The positions are solved once, memoized by their canonical key, and
+    written to `path` if it is given.
+    """
+    game = ttt.TicTacToe(size = size, k = k)
+    solver = Solver(size, k)
 
     moves = game.moves
-    min_max: list[list[float]] = [[] for _ in range(len(moves))]
+    min_max: list[list[tuple[float, float]]] = [[] for _ in range(len(moves))]
 
     for move in moves:
-        leaves: list[tuple[float, float]]
-
         game.do(move)
 
-        second_moves = game.moves
-        min_max[move] = [0.0] * len(moves)
-        for second_move in second_moves:
-            print(f"{move=}", file=sys.stderr)
+        min_max[move] = [(0.0, 0.0)] * len(moves)
+        for second_move in game.moves:
+            print(f"{move=} {second_move=} positions={len(solver)}", file=sys.stderr)
             game.do(second_move)
-            leaves = leave_chances(game)
-            exp_value = reduce(add, map(lambda tup: tup[0] * tup[1], leaves))
-            min_max[move][second_move] = exp_value
+            min_max[move][second_move] = solver.solve(game)
             game.undo()
 
         game.undo()
 
-    print ("MinMax values:")
+    print ("MinMax values (minimax, expected):")
     for i, values in enumerate(min_max):
-        for j, value in enumerate(values):
-            print(f"({i},{j}): {value:.2f}")
-    return 0
+        for j, (minimax, expected) in enumerate(values):
+            print(f"({i},{j}): {minimax:.2f} {expected:.2f}")
 
-def leave_chances(state: Game, level: int = 1) -> list[tuple[float, float]]:
-    """
-    Returns an array of all possible leaves from a game state.
-    """
-    if state.finished:
-        return [(state.points, (1.0/level))]
-
-    res: list[tuple[float, float]] = []
-    for move in state.moves:
-        branching = len(state.moves)
-        state.do(move)
-        res += leave_chances(state, level * branching)
-        state.undo()
-
-    return res
+    if path is not None:
+        solver.save(path)
+    return 0
 
 if __name__ == '__main__':
     s = int(sys.argv[1])
+    k_arg = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    path_arg = sys.argv[3] if len(sys.argv) > 3 else None
 
-    sys.exit(main(s))
+    sys.exit(main(s, k_arg, path_arg))
@@ -13,83 +13,42 @@ Classes:
 """
 
 from __future__ import annotations
-import copy
-from math import sqrt, log
 import random
 import sys
-from typing import Final
+from typing import Final, TYPE_CHECKING
 import numpy as np
 import numpy.typing as npt
 
+from cbt.algorithms import budget, parallel, rollout, small
+from cbt.algorithms.node import CBTNode, RootStats, confidence_bounds
+from cbt.algorithms.sampler import ArmSampler
 from cbt.game import Game
 from cbt.player import Player
 
-class CBTNode:
-    n: int
-    parent: CBTNode | None
-    children: list[CBTNode]
-    prev_move: int
-    n_accent: int
-    r: float
-    depth: int
-    leaf: bool
-    p: npt.NDArray[np.float64]
-    b: npt.NDArray[np.float64]
-    mu_hat: npt.NDArray[np.float64]
-    A_inv: npt.NDArray[np.float64]
-
-
-    def __init__(self, parent: CBTNode | None = None):
-        self.parent = parent
-        self.n_accent = 0
-        self.n = 0
-        self.children = []
-        self.r = 0
-
-        self.depth = parent.depth+1 if parent else 0
-
-    def add_child(self, move: int) -> CBTNode:
-        child = CBTNode(self)
-        child.prev_move = move
-        self.children.append(child)
-        return child
-
-    def add_parent(self, parent: CBTNode) -> None:
-        if self.parent:
-            raise RuntimeError("Node already has a parent")
-
-        self.parent = parent
-        self.depth = self.parent.depth+1
-
-    def print_tree(self) -> None:
-        """
-        Print the tree structure for debugging purposes.
-        """
-        print("\t" * self.depth + \
-            f"Node: {self.depth=}, {self.n=}, {self.r=}, {self.n_accent=}",
-            file=sys.stderr)
-        for child in self.children:
-            child.print_tree()
-
-    def avg_reward(self) -> float:
-        """
-        Calculate the average reward for the node.
-        """
-        if self.n == 0:
-            raise ValueError("Node has not been visited yet")
-        if self.leaf:
-            raise ValueError("Node is a leaf node")
-
-        return self.r / self.n
+if TYPE_CHECKING:
+    # Only for annotations, the tablebase module imports the TicTacToe
+    # module.
+    from cbt.algorithms.tablebase import Tablebase
 
 class CBandit:
     """
     Implements a contextual bandit algorithm for decision-making in the CBT framework.
+
+    The distribution of a node is updated in place, the temporaries of an
+    update live in scratch buffers of the bandit. The distribution of a node
+    with at most `small_k` moves is computed in pure Python instead, with
+    identical results, see `cbt.algorithms.small`.
     """
-    def __init__(self, nu: float = 10.0, gamma: float = 0.5) -> None:
+    small_k: int
+    _scratch: npt.NDArray[np.float64]
+
+    def __init__(self, nu: float = 10.0, gamma: float = 0.5,
+                 small_k: int = small.SMALL_K) -> None:
         self.nu = nu
         self.gamma = gamma
-        self.rng = np.random.default_rng()
+        self.small_k = small_k
+        self.sampler = ArmSampler(small_k=small_k)
+        self._scratch = np.empty((2, 0))
 
     def initialize_node(self, node: CBTNode, g: Game) -> None:
         """
@@ -98,39 +57,87 @@ class CBandit:
         length = len(g.moves)
         node.p = np.ones(length) / length
         node.leaf = False
+        node.arm = -1
+        node.cdf = None
 
-    def update_node(self, node: CBTNode, game: Game, _: int) -> None:
+    def update_node(self, node: CBTNode, _game: Game, _: int) -> None:
         """
         Update the statistics of the given node and its children based on the score.
         """
-        pi = np.zeros(len(game.moves))
-        for idx, child in enumerate(node.children):
-            if child.leaf:
-                pi[idx] = child.r
-            else:
-                pi[idx] = np.dot(child.p, child.mu_hat)
+        # One entry per move, without building the list of moves of the game.
+        length = len(node.p)
+        if length <= self.small_k:
+            self._update_small_node(node, length)
+            return
+
+        if self._scratch.shape[1] < length:
+            self._scratch = np.empty((2, length))
+        pi, gaps = self._scratch[0, :length], self._scratch[1, :length]
+
+        children = node.children
+        for idx, child in enumerate(children):
+            pi[idx] = child.r if child.leaf else self.value(child)
+        pi[len(children):] = 0
         j = np.argmax(pi)
-        for idx, pi_i in enumerate(pi):
-            if idx == j:
-                continue
-            node.p[idx] = 1 / (self.nu + self.gamma * (pi[j] - pi_i))
-        node.p[j] = 1 + node.p[j] - np.sum(node.p)
 
+        np.subtract(pi[j], pi, out=gaps)
+        np.multiply(gaps, self.gamma, out=gaps)
+        np.add(gaps, self.nu, out=gaps)
+        p_j = node.p[j]
+        np.divide(1, gaps, out=node.p)
+        node.p[j] = p_j
+        node.p[j] = 1 + p_j - np.sum(node.p)
+        node.cdf = None
+
+    def _update_small_node(self, node: CBTNode, length: int) -> None:
+        """
+        Update the distribution of the node like `update_node`, with Python
+        floats instead of NumPy arrays.
+        """
+        pi = [child.r if child.leaf else self.value(child) for child in node.children]
+        pi.extend([0.0] * (length - len(pi)))
+        j = small.argmax(pi)
+
+        p = small.inverse_gaps(pi, j, self.nu, self.gamma, sign=-1.0)
+        p_j = float(node.p[j])
+        p[j] = p_j
+        p[j] = 1 + p_j - small.pairwise_sum(p)
+        node.p[:] = p
+        node.cdf = None
+
+    @staticmethod
+    def value(node: CBTNode) -> float:
+        """
+        Return the predicted score of the node, `p` times `mu_hat`, computing
+        it if it is not cached.
+
+        The prediction only changes when the node itself is updated, see
+        `UCBBandit.update_node`.
+        """
+        if node.value is None:
+            node.value = float(np.dot(node.p, node.mu_hat))
+        return node.value
 
     def choose_arm(self, v: CBTNode) -> CBTNode:
         """
         Sample a child node (arm) based on the probability distribution p.
         """
-        choice = self.rng.choice(len(v.children), p=v.p)
-        return v.children[choice]
+        return v.children[self.sampler.sample(v)]
 
 class UCBBandit:
     """
     Implements the UCB bandit algorithm for move selection in the CBT framework.
+
+    The LCB1 values of a node with at most `small_k` children are computed
+    in pure Python, with identical results, see `cbt.algorithms.small`.
     """
+    small_k: int
+    _scratch: npt.NDArray[np.float64]
 
-    def __init__(self) -> None:
-        self.rng = np.random.default_rng()
+    def __init__(self, small_k: int = small.SMALL_K) -> None:
+        self.small_k = small_k
+        self.sampler = ArmSampler(small_k=small_k)
+        self._scratch = np.empty((2, 0))
 
     def initialize_node(self, node: CBTNode, game: Game) -> None:
         """
@@ -143,51 +150,83 @@ class UCBBandit:
             node.p = np.ones(length) / length
             node.leaf = False
             node.b = np.zeros(length)
-            node.A_inv = np.identity(length)
+            # Only the diagonal, see `update_regression`.
+            node.A_inv = np.ones(length)
             node.mu_hat = np.ones(length) / length
+            node.value = None
+            node.arm = -1
+            node.cdf = None
 
-    def update_node(self, node: CBTNode, game: Game, score: int) -> None:
+    def update_node(self, node: CBTNode, _game: Game, score: int) -> None:
         """
         Update the statistics of the given node and its children based on the score.
         """
         self._update_node_statistics(node, score)
 
-        if not node.leaf:
-            self._update_children_statistics(node)
-
         if node.children:
             if node.leaf:
                 return
-            idx, _ = min(enumerate(node.children), key=lambda tup: self.LCB1(tup[1]))
+            bounds = self.LCB1(node)
+            if len(node.children) <= self.small_k:
+                idx = small.argmin(bounds)
+            else:
+                idx = int(np.argmin(bounds))
 
-            node.p = np.zeros(len(game.moves))
-            node.p[idx] = 1
-            self.update_regression(node, score)
+            self.update_regression(node, idx, score)
+            self.set_arm(node, idx)
+            node.value = None
 
     def choose_arm(self, v: CBTNode) -> CBTNode:
         """
         Sample a child node (arm) based on the probability distribution p.
         """
-        choice = self.rng.choice(len(v.children), p=v.p)
-        return v.children[choice]
+        return v.children[self.sampler.sample(v)]
 
-    def LCB1(self, v: CBTNode) -> float:
+    def LCB1(self, v: CBTNode) -> npt.NDArray[np.float64] | list[float]:
         """
-        Calculate the UCB1 value for the given node.
+        Calculate the LCB1 values of all children of the given node, as a
+        list if the node has at most `small_k` children.
         """
         k: Final[float] = 0.75
-        return v.r / v.n - k * sqrt(log(v.n_accent) / v.n)
+        if len(v.children) <= self.small_k:
+            return small.confidence_bounds(v, len(v.children), -k)
+        if self._scratch.shape[1] < len(v.children):
+            self._scratch = np.empty((2, len(v.p)))
+        return confidence_bounds(v, len(v.children), -k, out=self._scratch)
 
-    def update_regression(self, node: CBTNode, score: float) -> None:
+    def update_regression(self, node: CBTNode, arm: int, score: float) -> None:
         """
         Update the regression parameters for the given node based on the score.
+
+        The context `node.p` of a UCB node is one-hot (1 at `arm`), so the
+        design matrix stays diagonal and the Sherman-Morrison update only
+        changes its `arm` entry. `node.A_inv` therefore only holds the
+        diagonal of the inverse, and an update only changes the `arm` entries
+        of `b`, `A_inv` and `mu_hat`, in O(1) instead of O(K^2).
+        """
+        node.b[arm] += score
+        a_inv = node.A_inv[arm]
+        node.A_inv[arm] = a_inv - a_inv * a_inv / (1 + a_inv)
+        if node.arm < 0:
+            # The first update replaces the uniform estimate of every arm.
+            np.multiply(node.b, node.A_inv, out=node.mu_hat)
+        else:
+            node.mu_hat[arm] = node.b[arm] * node.A_inv[arm]
+
+    @staticmethod
+    def set_arm(node: CBTNode, arm: int) -> None:
+        """
+        Make `node.p` one-hot at `arm`, in place.
+
+        Only the entry of the previous arm has to be cleared, the uniform
+        distribution of a new node is cleared once.
         """
-        node.b += score * node.p
-        mul_x = np.dot(node.A_inv, node.p)
-        num = np.outer(mul_x, mul_x)
-        denom = 1 + np.dot(node.p, mul_x)
-        node.A_inv -= num / denom
-        node.mu_hat = np.dot(node.b, node.A_inv)
+        if node.arm < 0:
+            node.p.fill(0)
+        else:
+            node.p[node.arm] = 0
+        node.p[arm] = 1
+        node.arm = arm
 
     # Helper methods
     def _update_node_statistics(self, node: CBTNode, score: int) -> None:
@@ -197,13 +236,6 @@ class UCBBandit:
         node.n += 1
         node.r += score
 
-    def _update_children_statistics(self, node: CBTNode) -> None:
-        """
-        Increment the n_accent value for all children of the given node.
-        """
-        for child in node.children:
-            child.n_accent += 1
-
 class CBT1:
     """
     Implements the Contextual Bandits for Tree search (CBT)
@@ -214,13 +246,23 @@ class CBT1:
     gamma: float
     game: Game
     wins: int
+    iterations: int
     root: CBTNode
+    tablebase: Tablebase | None
 
     def __init__(self, game: Game,
                  data_flag: bool = False,
                  print_flag: bool = False,
                  exploration: float = 10.0,
-                 learning_rate: float = 1000.0) -> None:
+                 learning_rate: float = 1000.0,
+                 rollouts: int = 1,
+                 tablebase: Tablebase | None = None) -> None:
+        """
+        Initialize the search for the current state of a game.
+
+        Raises:
+            ValueError: If the tablebase is for another board.
+        """
         self.K: int = len(game.moves)
         self.moves = game.moves
         self.game = game
@@ -230,12 +272,20 @@ class CBT1:
         self.ucb_bandit = UCBBandit()
         self.exploration = exploration
         self.learning_rate = learning_rate
+        self.rollouts = rollouts
+        self.tablebase = tablebase
+        if tablebase is not None:
+            tablebase.check(game)
         self.wins = 0
+        self.iterations = 0
 
-    def run(self, iters: int = 10000) -> dict[int, int]:
+    def run(self, iters: int = 10000, seconds: float | None = None) -> dict[int, int]:
         """
-        Run the CBT algorithm for a specified number of iterations and return the best move.
+        Run the CBT algorithm for a specified number of iterations, or until
+        `seconds` have passed if that comes first, and return the visits of
+        the moves at the root.
         """
+        end = budget.deadline(seconds)
 
         self.root = CBTNode()
         self.cbandit.initialize_node(self.root, self.game)
@@ -243,7 +293,11 @@ class CBT1:
         # Create all children of the root node.
         self.expand_root(self.root)
 
+        self.iterations = 0
         for i in range(iters):
+            if budget.expired(i, end):
+                break
+
             v = self.select(self.root)
 
             res = self.simulate()
@@ -258,9 +312,33 @@ class CBT1:
                     print(f"t={i}", file=sys.stderr)
 
             self.wins += res
+            self.iterations += 1
 
         return {child.prev_move: child.n for child in self.root.children}
 
+    def root_stats(self) -> RootStats:
+        """
+        Return the visits and rewards of the moves at the root, and the
+        distribution of the contextual bandit of the root over them.
+        """
+        root = self.root
+        moves = [child.prev_move for child in root.children]
+        return RootStats({move: child.n for move, child in zip(moves, root.children)},
+                         {move: child.r for move, child in zip(moves, root.children)},
+                         dict(zip(moves, root.p[:len(moves)].tolist())))
+
+    def seed(self, seed: int) -> None:
+        """
+        Seed the random numbers of the search: those of the module `random`,
+        which chooses the expanded moves and the moves of the rollouts, those
+        of the game, and those of both bandits.
+        """
+        streams = np.random.SeedSequence(seed).generate_state(4).tolist()
+        random.seed(streams[0])
+        self.game.seed(streams[1])
+        self.cbandit.sampler.rng = np.random.default_rng(streams[2])
+        self.ucb_bandit.sampler.rng = np.random.default_rng(streams[3])
+
     def select(self, v: CBTNode) -> CBTNode:
         """
         Traverse the tree to select a node for expansion.
@@ -309,7 +387,7 @@ class CBT1:
 
         return v
 
-    def backpropagate(self, v: CBTNode, score: int) -> None:
+    def backpropagate(self, v: CBTNode, score: float) -> None:
         """
         Update the statistics of all nodes along the path from the given node to the root.
         """
@@ -323,23 +401,31 @@ class CBT1:
             bandit.update_node(node, self.game, score)
 
             if node.parent is not None:
+                node.parent.update_child(node.index, score)
                 self.game.undo()
 
             node = node.parent
 
-    def simulate(self) -> int:
+    def simulate(self) -> float:
         """
         Simulate the game from the current board state to the end and return the score.
+
+        With more than one rollout per leaf, return the average score of the
+        rollouts. A position in the tablebase returns the exact expected score
+        of a rollout instead.
         """
-        game: Game = copy.deepcopy(self.game)
-        while not game.finished:
-            moves: list[int] = list(game.moves)
-            next_move: int = random.choice(moves)
-            game.do(next_move)
+        if self.tablebase is not None:
+            # Every rollout counts a draw as a loss, so its expected score is
+            # the probability that X wins.
+            win_probability = self.tablebase.win_probability(self.game)
+            if win_probability is not None:
+                return win_probability
 
-        score = int(game.points)
+        if self.rollouts == 1:
+            return int(rollout.simulate(self.game))
 
-        return score
+        # Truncate every outcome like a single rollout does, and average.
+        return float(np.floor(rollout.simulate_batch(self.game, self.rollouts)).mean())
 
     def missing_moves(self, v: CBTNode) -> list[int]:
         """
@@ -367,32 +453,68 @@ class CBT1:
         raise ValueError(f"Unknown method: {method}")
 
 class CBT1Player(Player):
+    """
+    A player that searches with CBT1.
+
+    With more than one of `workers`, the player runs a root-parallel search
+    in a pool of processes (see `cbt.algorithms.parallel`), and
+    `move_history` holds the visits of the moves summed over all searches.
+    """
     iterations: int
     nu: float
     gamma: float
     exploration: float
     learning_rate: float
-    alg: CBT1
+    alg: CBT1 | None
     move_history: dict[int, int]
+    rollouts: int
+    tablebase: Tablebase | None
+    workers: int
+    parallel: parallel.RootParallel | None
+    root_stats: RootStats | None
 
     def __init__(self, location, data_flag = False, print_flag = False):
         super().__init__(location, data_flag=data_flag, print_flag=print_flag)
         self.iterations = 1000
+        self.rollouts = 1
+        self.tablebase = None
         if location != 0:
             raise ValueError("CBTMinimalPlayer can only be used for player 0")
         self.exploration = 10.0
         self.learning_rate = 1000.0
         self.move_history = {}
+        self.alg = None
+        self.workers = 1
+        self.parallel = None
+        self.root_stats = None
 
     def make_move(self, game: Game) -> int:
-        self.alg = CBT1(game,
-            self.data_flag,
-            self.print_flag,
-            exploration=self.exploration,
-            learning_rate=self.learning_rate
-        )
-
-        self.move_history = self.alg.run(self.iterations)
+        game = self.searched(game)
+        options = {
+            "data_flag": self.data_flag,
+            "print_flag": self.print_flag,
+            "exploration": self.exploration,
+            "learning_rate": self.learning_rate,
+            "rollouts": self.rollouts,
+            "tablebase": self.tablebase,
+        }
+        limits = budget.limits(self.iterations, self.time_per_move)
+        if self.workers > 1:
+            if self.parallel is None or self.parallel.workers != self.workers:
+                if self.parallel is not None:
+                    self.parallel.close()
+                self.parallel = parallel.RootParallel(CBT1, self.workers)
+            self.alg = None
+            self.root_stats = self.parallel.run(game, *limits, **options).relabeled(game.real_move)
+            self.move_history = {move: int(visits)
+                                 for move, visits in self.root_stats.visits.items()}
+        else:
+            # The tree is not kept between moves: CBT1 has a contextual bandit
+            # only at the root and UCB bandits below it, so no node of the old
+            # tree can become the new root.
+            self.alg = CBT1(game, **options)
+            self.move_history = {game.real_move(move): visits
+                                 for move, visits in self.alg.run(*limits).items()}
         return max(self.move_history, key=lambda key: self.move_history[key])
 
     def set_parameters(self, exploration: float, learning_rate: float) -> None:
@@ -407,10 +529,24 @@ class CBT1Player(Player):
         """
         Calculate the win rate based on the number of wins and total iterations.
         """
-        return self.alg.wins / self.iterations
+        if self.alg is None:
+            if self.root_stats is None:
+                raise RuntimeError("No search to take the win rate from")
+            return sum(self.root_stats.rewards.values()) / sum(self.root_stats.visits.values())
+        return self.alg.wins / self.alg.iterations
 
     def best_move(self, method: str = "max_n") -> int:
         """
         Return the best move, based on some method. Default is the most visited node.
         """
-        return self.alg.get_best_move(method=method)
+        if self.alg is not None:
+            return self.alg.game.real_move(self.alg.get_best_move(method=method))
+        if self.root_stats is None:
+            raise RuntimeError("No search to take the best move from")
+
+        visits, rewards = self.root_stats.visits, self.root_stats.rewards
+        if method == 'max_n':
+            return max(visits, key=lambda move: visits[move])
+        if method == 'min_loss':
+            return max(visits, key=lambda move: rewards[move] / visits[move] if visits[move] else 0)
+        raise ValueError(f"Unknown method: {method}")
@@ -13,81 +13,71 @@ Classes:
 """
 
 from __future__ import annotations
-import copy
 import random
 import sys
+import threading
+from typing import Any, TYPE_CHECKING
 import numpy as np
 import numpy.typing as npt
 
+from cbt.algorithms import budget, parallel, rollout, small
+from cbt.algorithms.node import CBTNode, RootStats
+from cbt.algorithms.ponder import Ponderer
+from cbt.algorithms.regression import DenseRegression, HashedRegression
+from cbt.algorithms.sampler import ArmSampler
+from cbt.algorithms.transposition import TranspositionTable
 from cbt.game import Game
 from cbt.player import Player
 
-class CBTNode:
-    n: int
-    parent: CBTNode | None
-    children: list[CBTNode]
-    prev_move: int
-    n_accent: int
-    r: float
-    depth: int
-    leaf: bool
-    p: npt.NDArray[np.float64]
-    b: npt.NDArray[np.float64]
-    mu_hat: npt.NDArray[np.float64]
-    A_inv: npt.NDArray[np.float64]
-
-
-    def __init__(self, parent: CBTNode | None = None):
-        self.parent = parent
-        self.n_accent = 0
-        self.n = 0
-        self.children = []
-
-        self.depth = parent.depth+1 if parent else 0
-
-    def add_child(self, move: int) -> CBTNode:
-        child = CBTNode(self)
-        child.prev_move = move
-        self.children.append(child)
-        return child
-
-    def add_parent(self, parent: CBTNode) -> None:
-        if self.parent:
-            raise RuntimeError("Node already has a parent")
-
-        self.parent = parent
-        self.depth = self.parent.depth+1
-
-    def print_tree(self) -> None:
-        """
-        Print the tree structure for debugging purposes.
-        """
-        print("\t" * self.depth + \
-            f"Node: {self.depth=}, {self.n=}, {self.r=}, {self.n_accent=}",
-            file=sys.stderr)
-        for child in self.children:
-            child.print_tree()
+if TYPE_CHECKING:
+    # Only for annotations, the tablebase module imports the TicTacToe
+    # module.
+    from cbt.algorithms.tablebase import Tablebase
 
 class CBandit:
     """
     Implements a contextual bandit algorithm for decision-making in the CBT framework.
+
+    The regression state of a node (`b` and `A_inv`) is kept by the
+    `regression` backend, which only allocates it on the first update of the
+    node, many nodes are never updated. `mu_hat` is only computed when a
+    parent reads it, and recomputed in place after the next update.
+
+    Updates change the arrays of a node in place, and keep their
+    temporaries in scratch buffers of the bandit, so a node that is already
+    allocated is updated without allocating new arrays. The distribution of
+    a node with at most `small_k` children is computed in pure Python
+    instead, with identical results, see `cbt.algorithms.small`.
     """
-    def __init__(self, nu: float = 10, gamma: float = 0.5) -> None:
+    regression: DenseRegression
+    small_k: int
+    _scratch: npt.NDArray[np.float64]
+
+    def __init__(self, nu: float = 10, gamma: float = 0.5,
+                 regression: DenseRegression | None = None,
+                 small_k: int = small.SMALL_K) -> None:
         self.nu = nu
         self.gamma = gamma
-        self.rng = np.random.default_rng()
+        self.regression = DenseRegression() if regression is None else regression
+        self.small_k = small_k
+        self.sampler = ArmSampler(small_k=small_k)
+        self._scratch = np.empty((2, 0))
 
     def initialize_node(self, node: CBTNode, game: Game) -> None:
         """
-        Initialize the given node with uniform probabilities, identity matrix, and zero vectors.
+        Initialize the given node with uniform probabilities, the regression
+        state is allocated by the first update.
         """
         node.leaf = False
 
         length = len(game.moves)
         node.p = np.ones(length) / length
-        node.b = np.zeros(length)
-        node.A_inv = np.identity(length)
-        node.mu_hat = np.ones(length) / length
+        node.b = None
+        node.A_inv = None
+        node.mu_hat = None
+        node.value = None
+        node.arm = -1
+        node.cdf = None
 
     def update_node(self, node: CBTNode, game: Game, score: int, player: int) -> None:
         """
@@ -99,7 +89,7 @@ class CBandit:
             return
 
         if node.children:
-            self._update_distribution(node, game, player)
+            self._update_distribution(node, player)
 
             self._update_regression(node, score)
         else:
@@ -110,55 +100,103 @@ class CBandit:
         """
         Sample a child node (arm) based on the probability distribution p.
         """
-        choice = self.rng.choice(len(v.children), p=v.p)
-        return v.children[choice]
+        return v.children[self.choose_index(v)]
 
-    def _update_distribution(self, node: CBTNode, game: Game, player: int) -> None:
+    def choose_index(self, v: CBTNode) -> int:
+        """
+        Sample the index of a child node (arm) based on the probability distribution p.
+        """
+        return self.sampler.sample(v)
+
+    def value(self, node: CBTNode) -> float:
+        """
+        Return the predicted score of the node, `p` times `mu_hat`, computing
+        it if it is not cached.
+
+        The prediction only changes when the node itself is updated, so a
+        parent reads the cached values of all its children that were not on
+        the path of the last selection.
+        """
+        if node.value is None:
+            node.mu_hat = self.regression.estimate(node, node.mu_hat)
+            node.value = float(np.dot(node.p, node.mu_hat))
+        return node.value
+
+    def _update_distribution(self, node: CBTNode, player: int) -> None:
         if not node.children:
             raise RuntimeError("Node has no children")
 
-        pi = np.zeros(len(node.children))
-        for idx, child in enumerate(node.children):
-            if child.leaf:
-                # In this case we know for sure what the outcome will be,
-                # no need for predictions.
-                pi[idx] = child.r
-            else:
-                pi[idx] = np.dot(child.p, child.mu_hat)
+        children = node.children
+        k = len(children)
+        if len(node.p) <= self.small_k:
+            self._update_small_distribution(node, player)
+            return
+
+        if self._scratch.shape[1] < k:
+            self._scratch = np.empty((2, len(node.p)))
+        pi, gaps = self._scratch[0, :k], self._scratch[1, :k]
+
+        for idx, child in enumerate(children):
+            # The outcome of a leaf is known for sure, no need for predictions.
+            pi[idx] = child.r if child.leaf else self.value(child)
         if player == 0:
             j = np.argmax(pi)
+            np.subtract(pi, pi[j], out=gaps)
         elif player == 1:
             j = np.argmin(pi)
+            np.subtract(pi[j], pi, out=gaps)
+        else:
+            raise ValueError("Invalid player")
+        np.multiply(gaps, self.gamma, out=gaps)
+        np.add(gaps, self.nu, out=gaps)
+
+        # Pad p with zeroes, so children that are not yet added won't be selected.
+        p = node.p
+        np.divide(1, gaps, out=p[:k])
+        p[k:] = 0
+        p[j] = 0
+        p[j] = 1 - np.sum(p)
+        node.value = None
+        node.cdf = None
+
+    def _update_small_distribution(self, node: CBTNode, player: int) -> None:
+        """
+        Update the distribution of the node like `_update_distribution`,
+        with Python floats instead of NumPy arrays.
+        """
+        # The outcome of a leaf is known for sure, no need for predictions.
+        pi = [child.r if child.leaf else self.value(child) for child in node.children]
+        if player == 0:
+            j = small.argmax(pi)
+            p = small.inverse_gaps(pi, j, self.nu, self.gamma)
+        elif player == 1:
+            j = small.argmin(pi)
+            p = small.inverse_gaps(pi, j, self.nu, self.gamma, sign=-1.0)
         else:
             raise ValueError("Invalid player")
 
-        # Set p to zeroes, so children that are not yet added won't be selected.
-        node.p = np.zeros(len(game.moves))
-        for idx, pi_i in enumerate(pi):
-            if idx == j:
-                continue
-            if player == 1:
-                node.p[idx] = 1 / (self.nu + self.gamma * (pi[j] - pi_i))
-            elif player == 0:
-                node.p[idx] = 1 / (self.nu + self.gamma * (pi_i - pi[j]))
-        node.p[j] = 1 + node.p[j] - np.sum(node.p)
+        # Pad p with zeroes, so children that are not yet added won't be selected.
+        p.extend([0.0] * (len(node.p) - len(p)))
+        p[j] = 0.0
+        p[j] = 1 - small.pairwise_sum(p)
+        node.p[:] = p
+        node.value = None
+        node.cdf = None
 
     def _update_regression(self, node: CBTNode, score: float) -> None:
         """
         Update the regression parameters for the given node based on the score.
         """
-        node.b += score * node.p
-        mul_x = np.dot(node.A_inv, node.p)
-        num = np.outer(mul_x, mul_x)
-        denom = 1 + np.dot(node.p, mul_x)
-        node.A_inv -= num / denom
-        node.mu_hat = np.dot(node.b, node.A_inv)
+        self.regression.update(node, node.p, score)
+        node.value = None
 
 class CBT2:
     """
     Implements the Contextual Bandits for Tree search (CBT)
     algorithm for maximizing outcomes in a game-like environment.
     """
+    # The class of the nodes of the tree.
+    node_type: type[CBTNode] = CBTNode
     K: int
     nu: float
     gamma: float
@@ -166,32 +204,153 @@ class CBT2:
     player: int
     exploration: float
     learning_rate: float
+    path: list[CBTNode]
+    root: CBTNode | None
+    root_key: int | None
+    table: TranspositionTable[CBTNode] | None
+    max_nodes: int
+    nodes: int
+    tablebase: Tablebase | None
+    rng: random.Random | None
 
     def __init__(self, game: Game,
                  data_flag: bool = False,
                  print_flag: bool = False,
                  exploration: float = 10.0,
-                 learning_rate: float = 1000.0) -> None:
+                 learning_rate: float = 1000.0,
+                 rollouts: int = 1,
+                 transpositions: int = 0,
+                 tablebase: Tablebase | None = None,
+                 max_nodes: int = 0,
+                 float32: bool = False,
+                 sketch_dim: int = 0) -> None:
+        """
+        Initialize the search for the current state of a game.
+
+        Args:
+            game (Game): The game to search, the search plays on this game.
+            data_flag (bool): Flag to control printing of data for later analysis.
+            print_flag (bool): Flag to control printing of progress.
+            exploration (float): The exploration parameter nu of the bandit.
+            learning_rate (float): The learning rate gamma of the bandit.
+            rollouts (int): The number of rollouts per expanded leaf.
+            transpositions (int): The maximum number of positions in the
+                transposition table, which shares nodes (and their bandit
+                state) between move orders reaching the same position.
+                0 disables the table.
+            tablebase (Tablebase | None): Exact values of (near-terminal)
+                positions, a leaf in the tablebase is scored with the
+                probability that X wins instead of with rollouts.
+            max_nodes (int): The maximum number of nodes added to the tree,
+                after that leaves are simulated without expanding them.
+                A tree that is kept between searches (and re-rooted by
+                `advance`) counts the nodes it kept. 0 means no limit.
+            float32 (bool): Store the regression state of the bandit in
+                single precision, which halves its memory.
+            sketch_dim (int): Regress on a hashed sketch of the context with
+                this many features, so the regression state of a node with
+                K children takes O(sketch_dim^2) instead of O(K^2) memory.
+                0 keeps the exact regression.
+
+        Raises:
+            ValueError: If transpositions are enabled for a game without state
+                keys, or if the tablebase is for another board.
+        """
         self.K: int = len(game.moves)
         self.moves = game.moves
         self.game = game
         self.print_data = data_flag
         self.print_flag = print_flag
-        self.bandit = CBandit(nu=exploration, gamma=learning_rate)
+        dtype = np.float32 if float32 else np.float64
+        regression = HashedRegression(sketch_dim, dtype) if sketch_dim else DenseRegression(dtype)
+        self.bandit = CBandit(nu=exploration, gamma=learning_rate, regression=regression)
+        self.rollouts = rollouts
         self.player = 0
+        self.path = []
+        self.root = None
+        self.root_key = None
+        self.table = None
+        if transpositions:
+            if game.state_key is None:
+                raise ValueError(f"{game.name} has no state keys for transpositions")
+            self.table = TranspositionTable(transpositions)
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.tablebase = tablebase
+        if tablebase is not None:
+            tablebase.check(game)
+        # The generator of the rollouts, None for the module `random`.
+        self.rng = None
+
+    def run(self, iters: int = 1000, seconds: float | None = None) -> int:
+        """
+        Run the CBT algorithm for a specified number of iterations, or until
+        `seconds` have passed if that comes first, and return the best move.
+        """
+        self.search(iters, end=budget.deadline(seconds))
+        return self.best_move()
+
+    def best_move(self) -> int:
+        """
+        Return the move with the highest probability at the root.
 
-    def run(self, iters: int = 1000) -> int:
+        Raises:
+            RuntimeError: If nothing has been searched yet.
         """
-        Run the CBT algorithm for a specified number of iterations and return the best move.
+        root = self.root
+        if root is None or not root.children:
+            raise RuntimeError("No search to take the best move from")
+
+        # TODO: Think about what to return
+        best_move = root.child_moves[np.argmax(root.p)]
+        # best_child = max(root.children, key=lambda child: child.n)
+
+        return best_move
+
+    def root_stats(self) -> RootStats:
         """
+        Return the distribution of the bandit of the root over the moves,
+        CBT2 does not count the visits of its nodes.
+        """
+        root = self.root
+        if root is None or not root.children:
+            return RootStats({}, {}, {})
 
-        root = CBTNode()
-        self.bandit.initialize_node(root, self.game)
+        p = root.p[:len(root.children)].tolist()
+        return RootStats({}, {}, dict(zip(root.child_moves, p)))
+
+    def seed(self, seed: int) -> None:
+        """
+        Seed the random numbers of the search: those of the module `random`,
+        which chooses the expanded moves and the moves of the rollouts, those
+        of the game, and those of the bandit.
+        """
+        streams = np.random.SeedSequence(seed).generate_state(3).tolist()
+        random.seed(streams[0])
+        self.game.seed(streams[1])
+        self.bandit.sampler.rng = np.random.default_rng(streams[2])
+
+    def search(self, iters: int, stop: threading.Event | None = None,
+               end: float | None = None) -> CBTNode:
+        """
+        Grow the tree for `iters` iterations, or until `stop` is set or the
+        deadline `end` (see `cbt.algorithms.budget`) has passed, and return
+        its root.
+
+        The search continues on the tree of the previous search (or the tree
+        `advance` re-rooted) if its root has the state key of the game, and
+        starts a new tree otherwise. Games without state keys always start a
+        new tree.
+        """
+        root = self.tree_root()
 
         for i in range(iters):
+            if stop is not None and stop.is_set() or budget.expired(i, end):
+                break
+
             v = self.select(root)
 
-            if len(self.missing_moves(v)) > 0:
+            if len(self.missing_moves(v)) > 0 and not self.tree_full:
                 v = self.expand(v)
 
             res = self.simulate()
@@ -205,19 +364,78 @@ class CBT2:
                 if i % 10000 == 0:
                     print(f"t={i}")
 
-        # TODO: Think about what to return
-        best_child = root.children[np.argmax(root.p)]
-        # best_child = max(root.children, key=lambda child: child.n)
+        return root
+
+    def tree_root(self) -> CBTNode:
+        """
+        Return the root of the tree of the previous search (or the tree
+        `advance` re-rooted) if it has the state key of the game, and the
+        root of a new tree otherwise.
+        """
+        root = self.root
+        key = self.game.state_key
+        if root is None or key is None or key != self.root_key:
+            root = self.node_type()
+            self.root = root
+            self.root_key = key
+            self.nodes = 0
+            self.bandit.initialize_node(root, self.game)
+        return root
+
+    def ponder(self, game: Game, stop: threading.Event) -> None:
+        """
+        Grow the tree on `game`, a private copy of the game, until `stop` is set.
+
+        This runs in a background thread while the opponent thinks, so the
+        opponent can play on the game itself. The search must not be used
+        otherwise until the thread has finished.
+        """
+        own_game = self.game
+        self.game = game
+        try:
+            self.search(sys.maxsize, stop)
+        finally:
+            self.game = own_game
+
+    def advance(self, move: int) -> None:
+        """
+        Re-root the tree on the child reached by `move`, after the move is
+        played on the game, and drop the rest of the tree.
+
+        Without such a child, the next run starts a new tree.
+        """
+        root = self.root
+        self.root = None
+        if root is None or move not in root.child_moves:
+            return
 
-        return best_child.prev_move
+        child = root.children[root.child_moves.index(move)]
+        # A node linked by a transposition keeps its first parent.
+        if child.parent is root:
+            child.parent = None
+        self.root = child
+        # The nodes below the new root stay in the tree, the root itself was
+        # never counted.
+        self.nodes = child.memory().nodes - 1
+        self.root_key = self.game.state_key
+
+    @property
+    def tree_full(self) -> bool:
+        """
+        Return whether the tree has reached `max_nodes` nodes.
+        """
+        return 0 < self.max_nodes <= self.nodes
 
     def select(self, v: CBTNode) -> CBTNode:
         """
         Traverse the tree to select a node for expansion.
         """
+        self.path = [v]
         while len(self.missing_moves(v)) == 0 and not self.game.finished:
-            v = self.bandit.choose_arm(v)
-            self.player = self.game.do(v.prev_move)
+            idx = self.bandit.choose_index(v)
+            self.player = self.game.do(v.child_moves[idx])
+            v = v.children[idx]
+            self.path.append(v)
 
         return v
 
@@ -245,71 +463,170 @@ class CBT2:
         # which leads to a division by zero problem in de UCB1 calculation.
 
         new_move = random.choice(moves)
-        v = v.add_child(new_move)
-
         self.player = self.game.do(new_move)
-        self.bandit.initialize_node(v,self.game)
 
-        return v
+        child = self.table.get(self.game.state_key) if self.table is not None else None
+        if child is None:
+            child = v.add_child(new_move)
+            self.nodes += 1
+            self.bandit.initialize_node(child, self.game)
+            if self.table is not None:
+                self.table.put(self.game.state_key, child)
+        else:
+            v.link_child(child, new_move)
+
+        self.path.append(child)
+        return child
 
-    def backpropagate(self, v: CBTNode, score: int) -> None:
+    def backpropagate(self, v: CBTNode, score: float) -> None:
         """
-        Update the statistics of all nodes along the path from the given node to the root.
+        Update the statistics of all nodes along the path of the last
+        selection, from the given node to the root.
         """
-        node: CBTNode | None = v
-        while node:
+        if self.path[-1] is not v:
+            raise RuntimeError("Can only backpropagate from the last selected node")
+
+        for depth in range(len(self.path)-1, -1, -1):
             bandit = self.bandit
 
-            bandit.update_node(node, self.game, score, self.player)
+            bandit.update_node(self.path[depth], self.game, score, self.player)
 
-            if node.parent is not None:
+            if depth > 0:
                 self.player = self.game.undo()
 
-            node = node.parent
-
-    def simulate(self) -> int:
+    def simulate(self) -> float:
         """
         Simulate the game from the current board state to the end and return the score.
+
+        With more than one rollout per leaf, return the average score of the
+        rollouts. A position in the tablebase returns the exact expected score
+        of a rollout instead.
         """
-        game: Game = copy.deepcopy(self.game)
-        while not game.finished:
-            moves: list[int] = list(game.moves)
-            next_move: int = random.choice(moves)
-            game.do(next_move)
+        if self.tablebase is not None:
+            # Every rollout counts a draw as a loss, so its expected score is
+            # the probability that X wins.
+            win_probability = self.tablebase.win_probability(self.game)
+            if win_probability is not None:
+                return win_probability
 
-        score = int(game.points)
+        if self.rollouts == 1:
+            return int(rollout.simulate(self.game, self.rng))
 
-        return score
+        # Truncate every outcome like a single rollout does, and average.
+        return float(np.floor(rollout.simulate_batch(self.game, self.rollouts, self.rng)).mean())
 
     def missing_moves(self, v: CBTNode) -> list[int]:
         """
         Return a list of moves that are not yet explored from the given node.
         """
-        res = set(self.game.moves).difference(map(lambda child: child.prev_move, v.children))
+        res = set(self.game.moves).difference(v.child_moves)
         return list(res)
 
 class CBT2Player(Player):
+    """
+    A player that searches with CBT2.
+
+    With `reuse_tree` (off by default), the player keeps its search between
+    moves: it re-roots the tree on every move it observes, so the next
+    search starts with the statistics gathered under the moves that were
+    played. Otherwise every search starts with a new tree. With
+    `ponder` as well, the player keeps searching in the background after
+    its own move, until it observes the reply of the opponent.
+
+    With more than one of `workers`, the player runs a root-parallel search
+    in a pool of processes instead (see `cbt.algorithms.parallel`), which
+    starts every search with new trees.
+    """
     iterations: int
     exploration: float
     learning_rate: float
+    rollouts: int
+    transpositions: int
+    tablebase: Tablebase | None
+    float32: bool
+    sketch_dim: int
+    reuse_tree: bool
+    ponder: bool
+    alg: CBT2 | None
+    searched_game: Game | None
+    ponderer: Ponderer
+    moved: bool
+    workers: int
+    parallel: parallel.RootParallel | None
+    root_stats: RootStats | None
 
     def __init__(self, location, data_flag = False, print_flag = False):
         super().__init__(location, data_flag=data_flag, print_flag=print_flag)
         self.iterations = 1000
         self.exploration = 10.0
         self.learning_rate = 1000.0
+        self.rollouts = 1
+        self.transpositions = 0
+        self.tablebase = None
+        self.float32 = False
+        self.sketch_dim = 0
+        self.reuse_tree = False
+        self.ponder = False
+        self.alg = None
+        self.searched_game = None
+        self.ponderer = Ponderer()
+        self.moved = False
+        self.workers = 1
+        self.parallel = None
+        self.root_stats = None
 
     def make_move(self, game: Game) -> int:
-        alg = CBT2(
-            game,
-            self.data_flag,
-            self.print_flag,
-            self.exploration,
-            self.learning_rate
-        )
-
-        move = alg.run(self.iterations)
-        return move
+        self.ponderer.stop()
+        if self.workers > 1:
+            return self.parallel_move(game)
+
+        if self.alg is None or not self.reuse_tree or self.searched_game is not game:
+            self.alg = CBT2(self.searched(game), **self.options())
+            self.searched_game = game
+
+        move = self.alg.run(*budget.limits(self.iterations, self.time_per_move))
+        self.moved = True
+        return self.alg.game.real_move(move)
+
+    def observe_move(self, game: Game, move: int) -> None:
+        self.ponderer.stop()
+        if self.alg is not None and self.reuse_tree and self.searched_game is game:
+            self.alg.advance(self.alg.game.played_move(move))
+            if self.ponder and self.moved and not game.finished:
+                # Copied here, the opponent plays on the game while we ponder.
+                self.ponderer.start(self.alg, self.alg.game.clone())
+        self.moved = False
+
+    def parallel_move(self, game: Game) -> int:
+        """
+        Return the most probable move of a root-parallel search with `workers` processes.
+        """
+        if self.parallel is None or self.parallel.workers != self.workers:
+            if self.parallel is not None:
+                self.parallel.close()
+            self.parallel = parallel.RootParallel(CBT2, self.workers)
+        self.alg = None
+        searched = self.searched(game)
+        stats = self.parallel.run(
+            searched, *budget.limits(self.iterations, self.time_per_move), **self.options())
+        self.root_stats = stats.relabeled(searched.real_move)
+        return parallel.best_move(self.root_stats)
+
+    def options(self) -> dict[str, Any]:
+        """
+        Return the arguments of CBT2, other than the game, for the settings of the player.
+        """
+        return {
+            "data_flag": self.data_flag,
+            "print_flag": self.print_flag,
+            "exploration": self.exploration,
+            "learning_rate": self.learning_rate,
+            "rollouts": self.rollouts,
+            "transpositions": self.transpositions,
+            "tablebase": self.tablebase,
+            "float32": self.float32,
+            "sketch_dim": self.sketch_dim,
+        }
 
     def set_parameters(self, exploration: float, learning_rate: float) -> None:
         """
@@ -318,5 +635,15 @@ class CBT2Player(Player):
         self.exploration = exploration
         self.learning_rate = learning_rate
 
-    def best_move(self, _: str = "max_n"):
-        raise NotImplementedError("best_move is not implemented for CBT2Player")
+    def best_move(self, method: str = "max_n") -> int:
+        """
+        Return the move with the highest probability at the root of the last search.
+        """
+        if method != "max_n":
+            raise ValueError(f"Unknown method: {method}")
+        if self.alg is None:
+            if self.root_stats is None:
+                raise RuntimeError("No search to take the best move from")
+            return parallel.best_move(self.root_stats)
+
+        return self.alg.game.real_move(self.alg.best_move())
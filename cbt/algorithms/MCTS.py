@@ -1,70 +1,155 @@
 from __future__ import annotations
-import copy
-from math import log, sqrt
 import random
 import sys
-from typing import Final
+import threading
+from typing import Final, TYPE_CHECKING
 
-from cbt.game import Game
-
-class MCTSNode:
-    n: int
-    parent: MCTSNode | None
-    children: list[MCTSNode]
-    prev_move: int
-    n_accent: int
-    r: float
-    depth: int
-
-    def __init__(self, parent: MCTSNode | None = None):
-        self.parent = parent
-        self.n_accent = 0
-        self.n = 0
-        self.children = []
-        self.r = 0
-
-        self.depth = parent.depth+1 if parent else 0
-
-    def add_child(self, move: int) -> MCTSNode:
-        child = MCTSNode(self)
-        child.prev_move = move
-        self.children.append(child)
-        return child
-
-    def add_parent(self, parent: MCTSNode) -> None:
-        if self.parent:
-            raise RuntimeError("Node already has a parent")
+import numpy as np
 
-        self.parent = parent
-        self.depth = self.parent.depth+1
+from cbt.algorithms import budget, rollout
+from cbt.algorithms.node import REWARD, VISITS, MCTSNode, RootStats, confidence_bounds
+from cbt.algorithms.transposition import TranspositionTable
+from cbt.game import Game
 
-    def reward(self, b: Game) -> float:
-        if b.player == 0: # This gives an error, because the player is not
-            # exposed. However, most game do have the variable.
-            # TODO: Rewrite this to use the return values of `do()` and `undo()`
-            # instead of the player variable.
-            return self.r
+if TYPE_CHECKING:
+    # Only for annotations, the tablebase module imports the TicTacToe
+    # module, which imports this module.
+    from cbt.algorithms.tablebase import Tablebase
 
-        return -self.r
+# The exploration constant of the UCB1 values in the selection.
+EXPLORATION: Final[float] = 0.75
 
 class MCTS:
+    # The class of the nodes of the tree.
+    node_type: type[MCTSNode] = MCTSNode
     b: Game
+    path: list[MCTSNode]
+    arms: list[int]
+    root: MCTSNode | None
+    root_key: int | None
+    table: TranspositionTable[MCTSNode] | None
+    max_nodes: int
+    nodes: int
+    tablebase: Tablebase | None
+    rng: random.Random | None
 
     def __init__(self, game: Game,
                  data_flag: bool = False,
-                 print_flag: bool = False):
+                 print_flag: bool = False,
+                 rollouts: int = 1,
+                 transpositions: int = 0,
+                 tablebase: Tablebase | None = None,
+                 max_nodes: int = 0):
+        """
+        Initialize the search for the current state of a game.
+
+        Args:
+            game (Game): The game to search, the search plays on this game.
+            data_flag (bool): Flag to control printing of data for later analysis.
+            print_flag (bool): Flag to control printing of progress.
+            rollouts (int): The number of rollouts per expanded leaf.
+            transpositions (int): The maximum number of positions in the
+                transposition table, which shares nodes between move orders
+                reaching the same position. 0 disables the table.
+            tablebase (Tablebase | None): Exact values of (near-terminal)
+                positions, a leaf in the tablebase is scored with its expected
+                points instead of with rollouts.
+            max_nodes (int): The maximum number of nodes added to the tree,
+                after that leaves are simulated without expanding them.
+                A tree that is kept between searches (and re-rooted by
+                `advance`) counts the nodes it kept. 0 means no limit.
+
+        Raises:
+            ValueError: If transpositions are enabled for a game without state
+                keys, or if the tablebase is for another board.
+        """
         self.b = game
         self.data_flag = data_flag
         self.print_flag = print_flag
-
-    def run(self, iters: int = 1000) -> int:
-
-        root = MCTSNode()
+        self.rollouts = rollouts
+        self.path = []
+        self.arms = []
+        self.root = None
+        self.root_key = None
+        self.table = None
+        if transpositions:
+            if game.state_key is None:
+                raise ValueError(f"{game.name} has no state keys for transpositions")
+            self.table = TranspositionTable(transpositions)
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.tablebase = tablebase
+        if tablebase is not None:
+            tablebase.check(game)
+        # The generator of the rollouts, None for the module `random`.
+        self.rng = None
+
+    def run(self, iters: int = 1000, seconds: float | None = None) -> int:
+        """
+        Run the search for `iters` iterations, or until `seconds` have
+        passed if that comes first, and return the most visited move.
+        """
+        self.search(iters, end=budget.deadline(seconds))
+        return self.best_move()
+
+    def best_move(self) -> int:
+        """
+        Return the most visited move of the root.
+
+        Raises:
+            RuntimeError: If nothing has been searched yet.
+        """
+        root = self.root
+        if root is None or not root.children:
+            raise RuntimeError("No search to take the best move from")
+
+        idx = max(range(len(root.children)), key=lambda i: root.children[i].n)
+        return root.child_moves[idx]
+
+    def root_stats(self) -> RootStats:
+        """
+        Return the visits and rewards of the moves at the root, MCTS has no
+        distribution over them.
+        """
+        root = self.root
+        if root is None or not root.children:
+            return RootStats({}, {}, {})
+
+        stats = root.child_stats[:, :len(root.children)].tolist()
+        return RootStats(dict(zip(root.child_moves, stats[VISITS])),
+                         dict(zip(root.child_moves, stats[REWARD])), {})
+
+    def seed(self, seed: int) -> None:
+        """
+        Seed the random numbers of the search: those of the module `random`,
+        which chooses the expanded moves and the moves of the rollouts, and
+        those of the game.
+        """
+        streams = np.random.SeedSequence(seed).generate_state(2).tolist()
+        random.seed(streams[0])
+        self.b.seed(streams[1])
+
+    def search(self, iters: int, stop: threading.Event | None = None,
+               end: float | None = None) -> MCTSNode:
+        """
+        Grow the tree for `iters` iterations, or until `stop` is set or the
+        deadline `end` (see `cbt.algorithms.budget`) has passed, and return
+        its root.
+
+        The search continues on the tree of the previous search (or the tree
+        `advance` re-rooted) if its root has the state key of the game, and
+        starts a new tree otherwise. Games without state keys always start a
+        new tree.
+        """
+        root = self.tree_root()
 
         for i in range(iters):
+            if stop is not None and stop.is_set() or budget.expired(i, end):
+                break
+
             v = self.select(root)
 
-            if len(self.missing_moves(v)) > 0:
+            if len(self.missing_moves(v)) > 0 and not self.tree_full:
                 v = self.expand(v)
 
             res = self.simulate()
@@ -77,60 +162,138 @@ class MCTS:
                 if i % 10000 == 0:
                     print(f"t={i}", file=sys.stderr)
 
-        best_child = max(root.children, key=lambda child: child.n)
-        return best_child.prev_move
+        return root
+
+    def tree_root(self) -> MCTSNode:
+        """
+        Return the root of the tree of the previous search (or the tree
+        `advance` re-rooted) if it has the state key of the game, and the
+        root of a new tree otherwise.
+        """
+        root = self.root
+        key = self.b.state_key
+        if root is None or key is None or key != self.root_key:
+            root = self.node_type()
+            self.root = root
+            self.root_key = key
+            self.nodes = 0
+        return root
+
+    def ponder(self, game: Game, stop: threading.Event) -> None:
+        """
+        Grow the tree on `game`, a private copy of the game, until `stop` is set.
+
+        This runs in a background thread while the opponent thinks, so the
+        opponent can play on the game itself. The search must not be used
+        otherwise until the thread has finished.
+        """
+        own_game = self.b
+        self.b = game
+        try:
+            self.search(sys.maxsize, stop)
+        finally:
+            self.b = own_game
+
+    def advance(self, move: int) -> None:
+        """
+        Re-root the tree on the child reached by `move`, after the move is
+        played on the game, and drop the rest of the tree.
+
+        Without such a child, the next run starts a new tree.
+        """
+        root = self.root
+        self.root = None
+        if root is None or move not in root.child_moves:
+            return
+
+        child = root.children[root.child_moves.index(move)]
+        # A node linked by a transposition keeps its first parent.
+        if child.parent is root:
+            child.parent = None
+        self.root = child
+        # The nodes below the new root stay in the tree, the root itself was
+        # never counted.
+        self.nodes = child.memory().nodes - 1
+        self.root_key = self.b.state_key
+
+    @property
+    def tree_full(self) -> bool:
+        """
+        Return whether the tree has reached `max_nodes` nodes.
+        """
+        return 0 < self.max_nodes <= self.nodes
 
     def select(self, v: MCTSNode) -> MCTSNode:
-        def UCB1(v: MCTSNode) -> float:
-            k: Final[float] = 0.75
-            return v.reward(self.b)/v.n+k*sqrt(log(v.n_accent)/v.n)
-
+        self.path = [v]
+        self.arms = []
         while not self.b.finished \
             and len(self.missing_moves(v)) == 0:
-            v = max(v.children, key=UCB1)
-            self.b.do(v.prev_move)
+            children = v.children
+            # The UCB1 values of all children at once, with the rewards
+            # from the perspective of the player to move.
+            sign = 1.0 if self.b.player == 0 else -1.0
+            idx = int(np.argmax(confidence_bounds(v, len(children), EXPLORATION, sign)))
+            self.b.do(v.child_moves[idx])
+            v = children[idx]
+            self.path.append(v)
+            self.arms.append(idx)
         return v
 
     def expand(self, v: MCTSNode) -> MCTSNode:
         moves: list[int] = list(self.missing_moves(v))
 
         new_move = random.choice(moves)
-        v = v.add_child(new_move)
-
-        self.b.do(v.prev_move)
-        return v
+        self.b.do(new_move)
+
+        child = self.table.get(self.b.state_key) if self.table is not None else None
+        if child is None:
+            child = v.add_child(new_move)
+            self.nodes += 1
+            if self.table is not None:
+                self.table.put(self.b.state_key, child)
+            self.arms.append(child.index)
+        else:
+            v.link_child(child, new_move)
+            self.arms.append(len(v.children) - 1)
+
+        self.path.append(child)
+        return child
 
-    # Update visitations and scores in the entire tree
+    # Update visitations and scores in the entire tree, along the path
+    # of the last selection (with transpositions, `v.parent` is only the
+    # first parent of `v`).
     def backpropagate(self, v: MCTSNode, score: float) -> None:
-        node: MCTSNode | None = v
-        while node:
+        if self.path[-1] is not v:
+            raise RuntimeError("Can only backpropagate from the last selected node")
+
+        for depth in range(len(self.path)-1, -1, -1):
+            node = self.path[depth]
             node.n += 1
             node.r = node.r + score
 
-            # Here n' is incremented for all children, it should be
-            # siblings according to Cowling et al. (2012).
+            # The n' of all children follows from `node.n`, it should be
+            # counted for siblings according to Cowling et al. (2012).
             # TODO: Check that that makes a difference
-            for child in node.children:
-                child.n_accent += 1
+            if depth < len(self.arms):
+                node.update_child(self.arms[depth], score)
 
-            if node.parent is not None:
+            if depth > 0:
                 self.b.undo()
 
-            node = node.parent
-
-
-    # Simulate the rest of this determinization and return the end score.
+    # Simulate the rest of this determinization and return the end score,
+    # averaged over the rollouts per leaf. A position in the tablebase
+    # returns the exact expected score of a rollout instead.
     def simulate(self) -> float:
-        board: Game = copy.deepcopy(self.b)
-        while not board.finished:
-            moves: list[int] = list(board.moves)
-            next_move: int = random.choice(moves)
-            board.do(next_move)
+        if self.tablebase is not None:
+            expected = self.tablebase.expected(self.b)
+            if expected is not None:
+                return expected
 
-        score = board.points
+        if self.rollouts == 1:
+            return rollout.simulate(self.b, self.rng)
 
-        return score
+        return float(rollout.simulate_batch(self.b, self.rollouts, self.rng).mean())
 
     def missing_moves(self, v: MCTSNode) -> list[int]:
-        res = set(self.b.moves).difference(map(lambda child: child.prev_move, v.children))
+        res = set(self.b.moves).difference(v.child_moves)
         return list(res)
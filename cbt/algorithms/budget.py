@@ -0,0 +1,51 @@
+"""
+This module implements the time budgets of the searches.
+
+A search with a time budget runs until a deadline on the monotonic clock
+instead of for a number of iterations. The cost of an iteration differs a lot
+between boards, so the searches check the deadline during the search, but
+only every `CHECK_INTERVAL` iterations. A search overshoots its deadline by
+less than that many iterations. The first iteration always runs, so a search
+always has a move to return.
+
+Constants:
+    CHECK_INTERVAL: The number of iterations between two reads of the clock.
+
+Functions:
+    limits: The iterations and seconds of a search of a player.
+    deadline: The deadline of a time budget that starts now.
+    expired: Whether a search has to stop before its next iteration.
+"""
+
+from __future__ import annotations
+import sys
+import time
+
+CHECK_INTERVAL = 8
+
+def limits(iterations: int, seconds: float | None) -> tuple[int, float | None]:
+    """
+    Return the iterations and seconds to run a search of a player with: its
+    `iterations`, or without a limit on the iterations for `seconds` if the
+    player has a time per move.
+    """
+    if seconds is None:
+        return iterations, None
+    return sys.maxsize, seconds
+
+def deadline(seconds: float | None) -> float | None:
+    """
+    Return the time on the monotonic clock at which a budget of `seconds`
+    that starts now runs out, or None without a budget.
+    """
+    if seconds is None:
+        return None
+    return time.monotonic() + seconds
+
+def expired(iteration: int, end: float | None) -> bool:
+    """
+    Return whether the search has to stop before iteration `iteration`
+    (counted from 0) because it passed the deadline `end`.
+    """
+    return end is not None and iteration > 0 and iteration % CHECK_INTERVAL == 0 \
+        and time.monotonic() >= end
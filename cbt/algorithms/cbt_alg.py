@@ -1,10 +1,10 @@
-import copy
+from __future__ import annotations
 from math import sqrt, log
 import random
 from typing import Final, Protocol
 import numpy as np
 
-from cbt.algorithms.MCTS import MCTSNode
+from cbt.algorithms.node import CBTNode
 
 # CBT class tries to maximise the outcome
 
@@ -28,6 +28,9 @@ class Board(Protocol):
     def undo(self, place: int) -> None:
         pass
 
+    def clone(self) -> Board:
+        pass
+
 
 class Bandit:
     def __init__(self, nu: int, gamma: float) -> None:
@@ -35,7 +38,7 @@ class Bandit:
         self.gamma = gamma
         self.rng = np.random.default_rng()
 
-    def initialize_node(self, node: MCTSNode, b: Board) -> None:
+    def initialize_node(self, node: CBTNode, b: Board) -> None:
 
         length = len(b.moves)
         node.p = np.ones(length)/length
@@ -44,7 +47,7 @@ class Bandit:
         node.A_inv = np.identity(length)
         node.b = np.zeros(length)
 
-    def update_node(self, node: MCTSNode,
+    def update_node(self, node: CBTNode,
                     board: Board,
                     score: int) -> None:
         # The first lines (especially node.n) are used at other places,
@@ -52,12 +55,6 @@ class Bandit:
         node.n += 1
         node.r = node.r + score
 
-        # Here n' is incremented for all children, it should be
-        # siblings according to Cowling et al. (2012).
-        # TODO: Check that that makes a difference
-        for child in node.children:
-            child.n_accent += 1
-
         if board.finished:
             node.leaf = True
             node.r = score
@@ -92,12 +89,12 @@ class Bandit:
 
             node.p[j]=1+node.p[j]-np.sum(node.p)
 
-    def choose_arm(self, v: MCTSNode,
-                   _: Board) -> MCTSNode:
+    def choose_arm(self, v: CBTNode,
+                   _: Board) -> CBTNode:
         # Sample from the distribution p, regardles of what kind of node.
         return self.rng.choice(v.children, p=v.p)
 
-    def UCB1(self, v: MCTSNode, _: Board) -> float:
+    def UCB1(self, v: CBTNode, _: Board) -> float:
         k: Final[float] = 0.75
         if v.leaf:
             return v.r
@@ -107,7 +104,7 @@ class Bandit:
             print(f"There was an error at level {v.depth}")
             raise e
 
-    def update_regression(self, node: MCTSNode,
+    def update_regression(self, node: CBTNode,
                           _: Board, score: float) -> None:
         node.b = node.b + score * node.p
         mul_x = np.dot(node.A_inv, node.p)
@@ -144,7 +141,7 @@ class CBT:
             )
         bandit = Bandit(self.nu, self.gamma)
 
-        root = MCTSNode()
+        root = CBTNode()
         bandit.initialize_node(root, self.b)
 
         for _ in range(iters):
@@ -159,7 +156,7 @@ class CBT:
         best_child = max(root.children, key=lambda child: child.n)
         return best_child.prev_move
 
-    def select(self, bandit: Bandit, v: MCTSNode) -> MCTSNode:
+    def select(self, bandit: Bandit, v: CBTNode) -> CBTNode:
         while not self.b.finished and \
             len(self.missing_moves(v)) == 0 and v.depth < self.levels:
             v = bandit.choose_arm(v, self.b)
@@ -167,7 +164,7 @@ class CBT:
 
         return v
 
-    def expand(self, bandit: Bandit, v: MCTSNode) -> MCTSNode:
+    def expand(self, bandit: Bandit, v: CBTNode) -> CBTNode:
         moves: list[int] = list(self.missing_moves(v))
 
         #TODO: Change this to adding all children at once.
@@ -183,19 +180,20 @@ class CBT:
         return v
 
     # Update visitations and scores in the entire tree
-    def backpropagate(self, bandit: Bandit, v: MCTSNode, score: int) -> None:
-        node: MCTSNode | None = v
+    def backpropagate(self, bandit: Bandit, v: CBTNode, score: int) -> None:
+        node: CBTNode | None = v
         while node:
             bandit.update_node(node, self.b, score)
 
             if node.parent is not None:
+                node.parent.update_child(node.index, score)
                 self.b.undo(node.prev_move)
 
             node = node.parent
 
     # Simulate the rest of this determinization and return the end score.
     def simulate(self) -> int:
-        board: Board = copy.deepcopy(self.b)
+        board: Board = self.b.clone()
         while not board.finished:
             moves: list[int] = list(board.moves)
             next_move: int = random.choice(moves)
@@ -205,7 +203,7 @@ class CBT:
 
         return score
 
-    def missing_moves(self, v: MCTSNode) -> list[int]:
+    def missing_moves(self, v: CBTNode) -> list[int]:
         res = set(self.b.moves).difference(map(lambda child: child.prev_move, v.children))
         return list(res)
 
@@ -12,67 +12,31 @@ Classes:
 """
 
 from __future__ import annotations
-import copy
-from math import sqrt, log
+from math import sqrt
 import random
 import sys
 from typing import Final
 import numpy as np
 import numpy.typing as npt
 
+from cbt.algorithms import budget, rollout
+from cbt.algorithms.node import CBTNode, confidence_bounds
+from cbt.algorithms.sampler import ArmSampler
 from cbt.game import Game
 from cbt.player import Player
 
-class CBTNode:
-    n: int
-    parent: CBTNode | None
-    children: list[CBTNode]
-    prev_move: int
-    n_accent: int
-    r: float
-    depth: int
-    leaf: bool
-    p: npt.NDArray[np.float64]
-
-
-    def __init__(self, parent: CBTNode | None = None):
-        self.parent = parent
-        self.n_accent = 0
-        self.n = 0
-        self.children = []
-        self.r = 0
-
-        self.depth = parent.depth+1 if parent else 0
-
-    def add_child(self, move: int) -> CBTNode:
-        child = CBTNode(self)
-        child.prev_move = move
-        self.children.append(child)
-        return child
-
-    def add_parent(self, parent: CBTNode) -> None:
-        if self.parent:
-            raise RuntimeError("Node already has a parent")
-
-        self.parent = parent
-        self.depth = self.parent.depth+1
-
-    def print_tree(self) -> None:
-        """
-        Print the tree structure for debugging purposes.
-        """
-        print("\t" * self.depth + \
-            f"Node: {self.depth=}, {self.n=}, {self.r=}, {self.n_accent=}",
-            file=sys.stderr)
-        for child in self.children:
-            child.print_tree()
-
 class UCBBandit:
     """
     Implements a Upper Confidence Bound bandit algorithm.
+
+    The confidence bounds are computed in a scratch buffer of the bandit,
+    so an update does not allocate arrays.
     """
+    _scratch: npt.NDArray[np.float64]
+
     def __init__(self) -> None:
-        self.rng = np.random.default_rng()
+        self.sampler = ArmSampler()
+        self._scratch = np.empty((2, 0))
 
     def initialize_node(self, node: CBTNode, game: Game) -> None:
         """
@@ -84,52 +48,71 @@ class UCBBandit:
             length = len(game.moves)
             node.p = np.ones(length) / length
             node.leaf = False
+            node.arm = -1
+            node.cdf = None
 
-    def update_node(self, node: CBTNode, game: Game, score: int) -> None:
+    def update_node(self, node: CBTNode, _game: Game, score: int) -> None:
         """
         Update the statistics of the given node and its children based on the score.
         """
         node.n += 1
         node.r += score
 
-        if not node.leaf:
-            for child in node.children:
-                child.n_accent += 1
-
         if node.children:
             if node.leaf:
                 return
 
             if node.depth == 0:
-                idx, _ = max(enumerate(node.children), key=lambda tup: self.UCB1(tup[1]))
+                idx = int(np.argmax(self.UCB1(node)))
             elif node.depth == 1:
-                idx, _ = min(enumerate(node.children), key=lambda tup: self.LCB1(tup[1]))
+                idx = int(np.argmin(self.LCB1(node)))
             else:
                 raise RuntimeError("Invalid node depth")
 
-            node.p = np.zeros(len(game.moves))
-            node.p[idx] = 1
+            self.set_arm(node, idx)
 
     def choose_arm(self, v: CBTNode) -> CBTNode:
         """
         Sample a child node (arm) based on the probability distribution p.
         """
-        choice = self.rng.choice(len(v.children), p=v.p)
-        return v.children[choice]
+        return v.children[self.sampler.sample(v)]
+
+    @staticmethod
+    def set_arm(node: CBTNode, arm: int) -> None:
+        """
+        Make `node.p` one-hot at `arm`, in place.
+
+        Only the entry of the previous arm has to be cleared, the uniform
+        distribution of a new node is cleared once.
+        """
+        if node.arm < 0:
+            node.p.fill(0)
+        else:
+            node.p[node.arm] = 0
+        node.p[arm] = 1
+        node.arm = arm
 
-    def LCB1(self, v: CBTNode) -> float:
+    def LCB1(self, v: CBTNode) -> npt.NDArray[np.float64]:
         """
-        Calculate the UCB1 value for the given node.
+        Calculate the LCB1 values of all children of the given node.
         """
         k: Final[float] = 0.75
-        return v.r / v.n - k * sqrt(log(v.n_accent) / v.n)
+        return confidence_bounds(v, len(v.children), -k, out=self._buffer(v))
 
-    def UCB1(self, v: CBTNode) -> float:
+    def UCB1(self, v: CBTNode) -> npt.NDArray[np.float64]:
         """
-        Calculate the UCB1 value for the given node.
+        Calculate the UCB1 values of all children of the given node.
         """
         k: Final[float] = 0.75
-        return v.r / v.n + k * sqrt(log(v.n_accent) / v.n)
+        return confidence_bounds(v, len(v.children), k, out=self._buffer(v))
+
+    def _buffer(self, v: CBTNode) -> npt.NDArray[np.float64]:
+        """
+        Return the scratch buffer, grown to the children of the node if needed.
+        """
+        if self._scratch.shape[1] < len(v.children):
+            self._scratch = np.empty((2, len(v.p)))
+        return self._scratch
 
 class UCBMinimal:
     """
@@ -141,30 +124,41 @@ class UCBMinimal:
     gamma: float
     game: Game
     wins: int
+    iterations: int
     root: CBTNode
 
     def __init__(self, game: Game,
                  data_flag: bool = False,
-                 print_flag: bool = False) -> None:
+                 print_flag: bool = False,
+                 rollouts: int = 1) -> None:
         self.K: int = len(game.moves)
         self.moves = game.moves
         self.game = game
         self.print_data = data_flag
         self.print_flag = print_flag
         self.bandit = UCBBandit()
+        self.rollouts = rollouts
         self.wins = 0
+        self.iterations = 0
 
-    def run(self, iters: int = 10000) -> dict[int, int]:
+    def run(self, iters: int = 10000, seconds: float | None = None) -> dict[int, int]:
         """
-        Run the CBT algorithm for a specified number of iterations and return the best move.
+        Run the CBT algorithm for a specified number of iterations, or until
+        `seconds` have passed if that comes first, and return the visits of
+        the moves at the root.
         """
+        end = budget.deadline(seconds)
         self.root = CBTNode()
         self.bandit.initialize_node(self.root, self.game)
 
         # Create all children of the root node.
         self.expand_root(self.root)
 
+        self.iterations = 0
         for i in range(iters):
+            if budget.expired(i, end):
+                break
+
             v = self.select(self.root)
 
             res = self.simulate()
@@ -178,6 +172,7 @@ class UCBMinimal:
                     print(f"t={i}", file=sys.stderr)
 
             self.wins += res
+            self.iterations += 1
 
         # TODO: Think about what to return
 
@@ -234,7 +229,7 @@ class UCBMinimal:
 
         return v
 
-    def backpropagate(self, v: CBTNode, score: int) -> None:
+    def backpropagate(self, v: CBTNode, score: float) -> None:
         """
         Update the statistics of all nodes along the path from the given node to the root.
         """
@@ -243,23 +238,22 @@ class UCBMinimal:
             self.bandit.update_node(node, self.game, score)
 
             if node.parent is not None:
+                node.parent.update_child(node.index, score)
                 self.game.undo()
 
             node = node.parent
 
-    def simulate(self) -> int:
+    def simulate(self) -> float:
         """
         Simulate the game from the current board state to the end and return the score.
-        """
-        game: Game = copy.deepcopy(self.game)
-        while not game.finished:
-            moves: list[int] = list(game.moves)
-            next_move: int = random.choice(moves)
-            game.do(next_move)
 
-        score = int(game.points)
+        With more than one rollout per leaf, return the average score of the rollouts.
+        """
+        if self.rollouts == 1:
+            return int(rollout.simulate(self.game))
 
-        return score
+        # Truncate every outcome like a single rollout does, and average.
+        return float(np.floor(rollout.simulate_batch(self.game, self.rollouts)).mean())
 
     def missing_moves(self, v: CBTNode) -> list[int]:
         """
@@ -292,19 +286,22 @@ class UCBMinimal:
 class UCBPlayer(Player):
     alg: UCBMinimal
     move_history: dict[int, int]
+    rollouts: int
 
     def __init__(self, location, data_flag = False, print_flag: bool = False):
         super().__init__(location, data_flag=data_flag, print_flag=print_flag)
         self.iterations = 1000
+        self.rollouts = 1
         if location != 0:
             raise ValueError("UCBMinimalPlayer can only be used for player 0")
 
         self.move_history = {}
 
     def make_move(self, game: Game) -> int:
-        self.alg = UCBMinimal(game, data_flag=self.data_flag, print_flag=self.print_flag)
+        self.alg = UCBMinimal(game, data_flag=self.data_flag, print_flag=self.print_flag,
+                              rollouts=self.rollouts)
 
-        self.move_history = self.alg.run(self.iterations)
+        self.move_history = self.alg.run(*budget.limits(self.iterations, self.time_per_move))
         return max(self.move_history, key=lambda key: self.move_history[key])
 
     @property
@@ -312,7 +309,7 @@ class UCBPlayer(Player):
         """
         Calculate the win rate of the player.
         """
-        return self.alg.wins / self.iterations
+        return self.alg.wins / self.alg.iterations
 
     def best_move(self, method: str = "max_n") -> int:
         """
@@ -0,0 +1,311 @@
+"""
+This module implements the nodes of the search trees.
+
+All nodes use `__slots__`, so a node has no `__dict__` and only holds the
+fields it declares. The bandit state of the CBT algorithms lives in optional
+slots of `CBTNode`, which stay unset until a bandit initializes the node.
+
+Every parent also keeps the visits and rewards of its children in one array
+(`child_stats`, one column per child), so the confidence bounds of all
+children are computed at once with NumPy. The column of a child also holds
+the visits of the parent when the child was added, so the n' of UCB1 (the
+number of updates of the parent since then) follows from the parent's visits
+and does not have to be counted per child.
+
+Constants:
+    VISITS, REWARD, BORN: The rows of `child_stats`.
+
+Functions:
+    add_child_stats: Add the column of a new child to `child_stats`.
+    confidence_bounds: The UCB1 values of all children of a node.
+
+Classes:
+    Node: The statistics and links shared by all search trees.
+    MCTSNode: A node of the MCTS tree.
+    CBTNode: A node with slots for the state of the (contextual) bandits.
+    LockedMCTSNode, LockedCBTNode: Nodes of trees that threads share.
+    TreeMemory: The memory used by a tree.
+    RootStats: The statistics of the moves at the root of a search.
+"""
+
+from __future__ import annotations
+import sys
+import threading
+from typing import Callable, NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+from cbt.game import Game
+
+VISITS = 0
+REWARD = 1
+BORN = 2
+
+class TreeMemory(NamedTuple):
+    """
+    The number of nodes of a tree and the bytes they use, including their
+    lists of children and bandit arrays.
+    """
+    nodes: int
+    total_bytes: int
+
+    @property
+    def bytes_per_node(self) -> float:
+        return self.total_bytes / self.nodes if self.nodes else 0.0
+
+class RootStats(NamedTuple):
+    """
+    The statistics of the moves at the root of a search, by move: the visits
+    of each move, the sum of the rewards of those visits, and the
+    probability of each move under the bandit of the root. A search that
+    does not keep a statistic leaves it empty.
+    """
+    visits: dict[int, float]
+    rewards: dict[int, float]
+    distribution: dict[int, float]
+
+    def relabeled(self, move: Callable[[int], int]) -> RootStats:
+        """
+        Return the statistics with every move `m` replaced by `move(m)`.
+        """
+        return RootStats({move(m): value for m, value in self.visits.items()},
+                         {move(m): value for m, value in self.rewards.items()},
+                         {move(m): value for m, value in self.distribution.items()})
+
+class Node:
+    __slots__ = ("n", "parent", "children", "child_moves", "prev_move",
+                 "index", "r", "depth", "child_stats")
+
+    n: int
+    parent: Node | None
+    children: list[Node]
+    child_moves: list[int]
+    prev_move: int
+    index: int
+    r: float
+    depth: int
+    child_stats: npt.NDArray[np.float64] | None
+
+    def __init__(self, parent: Node | None = None):
+        self.parent = parent
+        self.index = 0
+        self.n = 0
+        self.children = []
+        self.child_moves = []
+        self.r = 0
+        self.child_stats = None
+
+        self.depth = parent.depth+1 if parent else 0
+
+    def add_child(self, move: int) -> Node:
+        child = self.__class__(self)
+        child.prev_move = move
+        child.index = len(self.children)
+        self.link_child(child, move)
+        return child
+
+    def link_child(self, child: Node, move: int) -> None:
+        """
+        Add an existing node as the child reached by `move`.
+
+        With transpositions a node can be the child of several parents, so
+        the move to a child is stored on the parent, in `child_moves`, and
+        the statistics in `child_stats` are those of the visits through this
+        parent. `index` is the position of a child under its first parent.
+        """
+        self.child_stats = add_child_stats(self.child_stats, len(self.children), self.n)
+        self.children.append(child)
+        self.child_moves.append(move)
+
+    def update_child(self, idx: int, score: float) -> None:
+        """
+        Add a visit with `score` to the statistics of child `idx`.
+        """
+        stats = self.child_stats
+        stats[VISITS, idx] += 1
+        stats[REWARD, idx] += score
+
+    @property
+    def n_accent(self) -> int:
+        """
+        Return the number of updates of the parent since this node was
+        added, the n' of UCB1 (0 for the root).
+        """
+        parent = self.parent
+        if parent is None:
+            return 0
+        return parent.n - int(parent.child_stats[BORN, self.index])
+
+    def add_parent(self, parent: Node) -> None:
+        if self.parent:
+            raise RuntimeError("Node already has a parent")
+
+        self.parent = parent
+        self.depth = self.parent.depth+1
+
+    def print_tree(self) -> None:
+        """
+        Print the tree structure for debugging purposes.
+        """
+        print("\t" * self.depth + \
+            f"Node: {self.depth=}, {self.n=}, {self.r=}, {self.n_accent=}",
+            file=sys.stderr)
+        for child in self.children:
+            child.print_tree()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Return the bytes used by this node and its lists of children, without
+        the children themselves.
+        """
+        stats = 0 if self.child_stats is None else sys.getsizeof(self.child_stats)
+        return sys.getsizeof(self) + sys.getsizeof(self.children) \
+            + sys.getsizeof(self.child_moves) + stats
+
+    def memory(self) -> TreeMemory:
+        """
+        Return the number of nodes and the bytes used by the tree below this node.
+
+        Nodes that are shared between parents (by transpositions) are counted once.
+        """
+        seen: set[int] = set()
+        total = 0
+        stack: list[Node] = [self]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            total += node.nbytes
+            stack.extend(node.children)
+        return TreeMemory(len(seen), total)
+
+def add_child_stats(stats: npt.NDArray[np.float64] | None, k: int,
+                    born: int) -> npt.NDArray[np.float64]:
+    """
+    Return `stats` with the column of child `k` set to no visits and no
+    reward, born when the parent had `born` visits.
+
+    The array grows by doubling, so a new array is only returned when `stats`
+    is full (or None).
+    """
+    if stats is None or stats.shape[1] == k:
+        grown = np.empty((3, max(4, 2 * k)))
+        if stats is not None:
+            grown[:, :k] = stats
+        stats = grown
+    stats[VISITS, k] = 0
+    stats[REWARD, k] = 0
+    stats[BORN, k] = born
+    return stats
+
+def confidence_bounds(node: Node, k: int, exploration: float, sign: float = 1.0,
+                      out: npt.NDArray[np.float64] | None = None) -> npt.NDArray[np.float64]:
+    """
+    Return `sign` times the average reward plus `exploration` times the
+    UCB1 confidence radius, for the first `k` children of the node.
+
+    A negative `exploration` gives lower confidence bounds. With `out`, a
+    scratch array of at least 2 x `k`, the bounds are computed in its first
+    row without allocating temporaries, with the same results.
+    """
+    visits, reward, born = node.child_stats[:, :k]
+    if out is None:
+        return sign * reward / visits + exploration * np.sqrt(np.log(node.n - born) / visits)
+
+    bounds, radius = out[0, :k], out[1, :k]
+    np.subtract(node.n, born, out=radius)
+    np.log(radius, out=radius)
+    np.divide(radius, visits, out=radius)
+    np.sqrt(radius, out=radius)
+    np.multiply(exploration, radius, out=radius)
+    np.multiply(sign, reward, out=bounds)
+    np.divide(bounds, visits, out=bounds)
+    np.add(bounds, radius, out=bounds)
+    return bounds
+
+class MCTSNode(Node):
+    __slots__ = ()
+
+    def reward(self, b: Game) -> float:
+        if b.player == 0: # This gives an error, because the player is not
+            # exposed. However, most game do have the variable.
+            # TODO: Rewrite this to use the return values of `do()` and `undo()`
+            # instead of the player variable.
+            return self.r
+
+        return -self.r
+
+class CBTNode(Node):
+    """
+    Node with slots for the bandit state: the distribution `p` over the
+    children, and the regression vectors `b` and `mu_hat` and inverse design
+    matrix `A_inv`. Bandits with one-hot contexts keep only the diagonal of
+    `A_inv`, as a vector, and the index of the one in `p` as `arm` (-1 while
+    `p` is not one-hot). `value` caches the predicted score `p` times
+    `mu_hat` for the parent, and `cdf` the cumulative distribution of `p` for
+    the `ArmSampler`. The regression state is None while a bandit has not
+    allocated (or, for `mu_hat`, `value` and `cdf`, computed) it yet.
+    """
+    __slots__ = ("leaf", "p", "b", "mu_hat", "A_inv", "value", "arm", "cdf")
+
+    leaf: bool
+    p: npt.NDArray[np.float64]
+    b: npt.NDArray[np.floating] | None
+    mu_hat: npt.NDArray[np.floating] | None
+    A_inv: npt.NDArray[np.floating] | None
+    value: float | None
+    arm: int
+    cdf: list[float] | None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Return the bytes used by this node, its lists of children and the
+        bandit arrays that are set, without the children themselves.
+        """
+        arrays = (getattr(self, name, None) for name in ("p", "b", "mu_hat", "A_inv"))
+        return super().nbytes + sum(sys.getsizeof(array) for array in arrays
+                                    if array is not None)
+
+    def avg_reward(self) -> float:
+        """
+        Calculate the average reward for the node.
+        """
+        if self.n == 0:
+            raise ValueError("Node has not been visited yet")
+        if self.leaf:
+            raise ValueError("Node is a leaf node")
+
+        return self.r / self.n
+
+class LockedMCTSNode(MCTSNode):
+    """
+    A node of an MCTS tree that several threads grow, with the lock that
+    guards its statistics and children (see `cbt.algorithms.shared`).
+    """
+    __slots__ = ("lock",)
+
+    lock: threading.Lock
+
+    def __init__(self, parent: Node | None = None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+
+class LockedCBTNode(CBTNode):
+    """
+    A node of a CBT2 tree that several threads grow, with the lock that
+    guards its bandit state and children, and the number of threads that
+    are `pending` below it. The parent's lock guards `pending`.
+    """
+    __slots__ = ("lock", "pending")
+
+    lock: threading.Lock
+    pending: int
+
+    def __init__(self, parent: Node | None = None):
+        super().__init__(parent)
+        self.lock = threading.Lock()
+        self.pending = 0
@@ -0,0 +1,149 @@
+"""
+This module implements root-parallel search.
+
+A root-parallel search runs independent searches from the same position in
+a pool of processes, and merges the statistics of the moves at their roots
+(see `RootStats`): the visits and rewards of the workers are added up, and
+their distributions averaged. Every search is seeded with its own stream of
+a `SeedSequence`, so the workers do not repeat each other, and a seeded
+search is reproducible.
+
+The workers do not share their trees, so root-parallel search does not
+search deeper than a single search, it averages out the noise of the
+searches at the root. With one worker per core it runs `workers` times the
+iterations in the same wall-clock time.
+
+Classes:
+    RootParallel: Runs searches of one algorithm from the same root in a pool of processes.
+
+Functions:
+    merge_root_stats: Merge the root statistics of several searches.
+    best_move: The best move according to merged root statistics.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Any, Protocol
+
+import numpy as np
+
+from cbt.algorithms.node import RootStats
+from cbt.game import Game
+
+class Search(Protocol):
+    """
+    A search that can run in a worker of `RootParallel`, like `CBT1`, `CBT2` and `MCTS`.
+    """
+    def seed(self, seed: int) -> None: ...
+    def run(self, iters: int, seconds: float | None = None) -> Any: ...
+    def root_stats(self) -> RootStats: ...
+
+class RootParallel:
+    """
+    Runs `workers` independent searches of `algorithm` from the same
+    position in a pool of processes, and merges their root statistics.
+
+    The pool is started by the first run and kept for the next ones, until
+    `close` (or the end of a `with` block).
+    """
+    algorithm: type[Search]
+    workers: int
+    _seeds: np.random.SeedSequence
+    _pool: ProcessPoolExecutor | None
+
+    def __init__(self, algorithm: type[Search], workers: int | None = None,
+                 seed: int | None = None) -> None:
+        """
+        Args:
+            algorithm (type): The search to run, `CBT1`, `CBT2` or `MCTS`.
+            workers (int | None): The number of searches and processes, by
+                default one per core.
+            seed (int | None): The seed of the streams of the searches, None
+                for fresh entropy.
+        """
+        self.algorithm = algorithm
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        if self.workers < 1:
+            raise ValueError("A parallel search needs at least one worker")
+        self._seeds = np.random.SeedSequence(seed)
+        self._pool = None
+
+    def __enter__(self) -> RootParallel:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def run(self, game: Game, iters: int, seconds: float | None = None,
+            **options: Any) -> RootStats:
+        """
+        Run a search of `iters` iterations (or `seconds`, see the `run` of
+        the algorithm) on `game` in every worker, and return their merged
+        root statistics.
+
+        The `options` are passed on to the constructor of the algorithm.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+
+        seeds = [int(child.generate_state(1)[0]) for child in self._seeds.spawn(self.workers)]
+        futures = [self._pool.submit(_search, self.algorithm, game, options, iters, seconds, seed)
+                   for seed in seeds]
+        return merge_root_stats([future.result() for future in futures])
+
+    def close(self) -> None:
+        """
+        Shut down the pool of processes.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+def _search(algorithm: type[Search], game: Game, options: dict[str, Any],
+            iters: int, seconds: float | None, seed: int) -> RootStats:
+    """
+    Run one seeded search in a worker and return its root statistics.
+    """
+    alg = algorithm(game, **options)
+    alg.seed(seed)
+    alg.run(iters, seconds)
+    return alg.root_stats()
+
+def merge_root_stats(stats: list[RootStats]) -> RootStats:
+    """
+    Return the sum of the visits and rewards of every move over all
+    searches, and its average probability.
+
+    A move that is missing from the distribution of a search counts as
+    probability 0 for that search.
+    """
+    visits: dict[int, float] = {}
+    rewards: dict[int, float] = {}
+    distribution: dict[int, float] = {}
+    for stat in stats:
+        for move, value in stat.visits.items():
+            visits[move] = visits.get(move, 0) + value
+        for move, value in stat.rewards.items():
+            rewards[move] = rewards.get(move, 0.0) + value
+        for move, value in stat.distribution.items():
+            distribution[move] = distribution.get(move, 0.0) + value
+
+    if stats:
+        for move in distribution:
+            distribution[move] /= len(stats)
+    return RootStats(visits, rewards, distribution)
+
+def best_move(stats: RootStats) -> int:
+    """
+    Return the most visited move, or the most probable move if the searches
+    do not count visits.
+
+    Raises:
+        ValueError: If the statistics have no moves.
+    """
+    if stats.visits:
+        return max(stats.visits, key=lambda move: stats.visits[move])
+    if stats.distribution:
+        return max(stats.distribution, key=lambda move: stats.distribution[move])
+    raise ValueError("The statistics have no moves")
@@ -0,0 +1,72 @@
+"""
+This module implements pondering: searching while the opponent thinks.
+
+A player that keeps its search tree between moves (see `Player.observe_move`)
+can grow the tree after its own move as well, while it waits for the reply
+of the opponent. `Ponderer` runs the search in a background thread, on a
+private copy of the game, so the opponent can play on the game itself. When
+the reply arrives the player stops the thread and re-roots the tree on it,
+and the iterations spent on the reply that was played are not lost.
+
+The thread shares the interpreter with the opponent, so pondering gains the
+most against opponents that wait on something else than the CPU (a human,
+or a search in another process), or on a free-threaded Python.
+
+Classes:
+    Search: The searches that can ponder.
+    Ponderer: Runs the search of a player in a background thread.
+"""
+
+from __future__ import annotations
+import threading
+from typing import Protocol
+
+from cbt.game import Game
+
+class Search(Protocol):
+    """
+    A search that grows its tree on a private copy of the game until stopped.
+    """
+    def ponder(self, game: Game, stop: threading.Event) -> None: ...
+
+class Ponderer:
+    """
+    Runs the pondering of one search at a time in a background thread.
+    """
+    _stop: threading.Event
+    _thread: threading.Thread | None
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def pondering(self) -> bool:
+        """
+        Return whether a search is pondering.
+        """
+        return self._thread is not None
+
+    def start(self, search: Search, game: Game) -> None:
+        """
+        Let `search` ponder on `game`, a private copy of the game, until `stop`.
+
+        The copy has to be made by the caller, before the opponent plays on
+        the game again.
+        """
+        self.stop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=search.ponder, args=(game, self._stop),
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the pondering search, if any, and wait until its thread finished.
+        """
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
@@ -0,0 +1,146 @@
+"""
+This module implements the regression backends of the contextual bandit of CBT2.
+
+The bandit of a node regresses the scores of its updates on the context `p`
+(the distribution over the K children of the node) with ridge regression. A
+backend keeps the regression state of a node in the node's slots (`b` and
+`A_inv`), allocates it on the first update, and computes the estimate
+`mu_hat` (a weight per child) from it.
+
+Classes:
+    DenseRegression: Exact regression with a K x K inverse per node.
+    HashedRegression: Regression on a hashed sketch of the context, with a
+        `dim` x `dim` inverse per node.
+"""
+
+from __future__ import annotations
+from functools import cache
+
+import numpy as np
+import numpy.typing as npt
+
+from cbt.algorithms.node import CBTNode
+
+class DenseRegression:
+    """
+    Ridge regression on the full context, updated with Sherman-Morrison.
+
+    A node with K children holds a K x K inverse design matrix. The state of
+    a node is updated in place, the temporaries of an update live in scratch
+    buffers of the backend, which are reused between updates.
+    """
+    dtype: np.dtype
+    _vectors: npt.NDArray[np.float64]
+    _matrix: npt.NDArray[np.float64]
+
+    def __init__(self, dtype: npt.DTypeLike = np.float64) -> None:
+        self.dtype = np.dtype(dtype)
+        self._vectors = np.empty((2, 0))
+        self._matrix = np.empty(0)
+
+    def update(self, node: CBTNode, x: npt.NDArray[np.float64], score: float) -> None:
+        """
+        Add the observation of `score` in context `x` to the regression of the node.
+        """
+        if node.b is None or node.A_inv is None:
+            node.b = np.zeros(len(x), dtype=self.dtype)
+            node.A_inv = np.identity(len(x), dtype=self.dtype)
+
+        scaled_x, mul_x, num = self._scratch(len(x))
+        np.multiply(x, score, out=scaled_x)
+        np.add(node.b, scaled_x, out=node.b)
+
+        np.dot(node.A_inv, x, out=mul_x)
+        denom = 1 + np.dot(x, mul_x)
+        # The product of a column and a row, a broadcast multiply would
+        # allocate the buffers of the iterator.
+        np.dot(mul_x[:, None], mul_x[None, :], out=num)
+        np.divide(num, denom, out=num)
+        np.subtract(node.A_inv, num, out=node.A_inv)
+
+    def estimate(self, node: CBTNode,
+                 out: npt.NDArray[np.floating] | None = None) -> npt.NDArray[np.floating]:
+        """
+        Return the estimated weight of every child of the node.
+
+        Before the first update, the estimate is uniform. The estimate is
+        written into `out` if it is given, and returned.
+        """
+        if out is None:
+            out = np.empty(len(node.p), dtype=self.dtype)
+        if node.b is None:
+            out.fill(1 / len(node.p))
+        else:
+            np.dot(node.b, node.A_inv, out=out)
+        return out
+
+    def _scratch(self, k: int) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64],
+                                        npt.NDArray[np.float64]]:
+        """
+        Return two scratch vectors of length `k` and a contiguous `k` x `k`
+        scratch matrix.
+        """
+        if self._vectors.shape[1] < k:
+            self._vectors = np.empty((2, k))
+            self._matrix = np.empty(k * k)
+        return self._vectors[0, :k], self._vectors[1, :k], self._matrix[:k * k].reshape(k, k)
+
+class HashedRegression(DenseRegression):
+    """
+    Ridge regression on a sketch of the context with `dim` features.
+
+    Every child is hashed to one of `dim` buckets, with a random sign, and
+    the sketch of a context is the signed sum of its entries per bucket. The
+    regression runs on the sketch, so a node holds a `dim` x `dim` inverse,
+    and the estimate of a child is the signed weight of its bucket. Nodes
+    with at most `dim` children are not hashed, their regression is exact.
+    """
+    dim: int
+    seed: int
+    _sketch: npt.NDArray[np.float64]
+    _weights: npt.NDArray[np.floating]
+
+    def __init__(self, dim: int = 16, dtype: npt.DTypeLike = np.float64, seed: int = 0) -> None:
+        if dim < 1:
+            raise ValueError("A sketch needs at least one dimension")
+
+        super().__init__(dtype)
+        self.dim = dim
+        self.seed = seed
+        self._sketch = np.empty(dim)
+        self._weights = np.empty(dim, dtype=self.dtype)
+
+    def update(self, node: CBTNode, x: npt.NDArray[np.float64], score: float) -> None:
+        if len(x) <= self.dim:
+            super().update(node, x, score)
+            return
+
+        np.dot(_hash_tables(len(x), self.dim, self.seed)[2], x, out=self._sketch)
+        super().update(node, self._sketch, score)
+
+    def estimate(self, node: CBTNode,
+                 out: npt.NDArray[np.floating] | None = None) -> npt.NDArray[np.floating]:
+        if node.b is None or len(node.p) <= self.dim:
+            return super().estimate(node, out)
+
+        if out is None:
+            out = np.empty(len(node.p), dtype=self.dtype)
+        buckets, signs, _ = _hash_tables(len(node.p), self.dim, self.seed)
+        np.dot(node.b, node.A_inv, out=self._weights)
+        np.take(self._weights, buckets, out=out)
+        np.multiply(out, signs, out=out)
+        return out
+
+@cache
+def _hash_tables(k: int, dim: int, seed: int) -> tuple[npt.NDArray[np.intp],
+                                                        npt.NDArray[np.float64],
+                                                        npt.NDArray[np.float64]]:
+    """
+    Return the bucket and the sign of each of `k` children, for a sketch of
+    `dim` features, and the `dim` x `k` matrix that maps a context to its sketch.
+    """
+    rng = np.random.default_rng(seed)
+    buckets, signs = rng.integers(dim, size=k), rng.choice([-1.0, 1.0], size=k)
+    sketch = np.zeros((dim, k))
+    sketch[buckets, np.arange(k)] = signs
+    return buckets, signs, sketch
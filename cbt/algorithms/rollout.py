@@ -0,0 +1,65 @@
+"""
+This module implements the random rollouts shared by the search algorithms.
+
+Rollouts are played directly on the game that is being searched: the random
+moves are played with `do()` and rewound with `undo()` afterwards, so no copy
+of the game has to be made. Games that implement `random_playouts(n)` can
+play a batch of rollouts at once. The moves are drawn with the module `random`,
+or with the generator `rng` of a search that has its own.
+"""
+
+import random
+import numpy as np
+import numpy.typing as npt
+
+from cbt.game import Game
+
+def simulate(game: Game, rng: random.Random | None = None) -> float:
+    """
+    Play random moves until the game is finished, and return the points.
+
+    The game is returned to the state it was in before the rollout.
+
+    Args:
+        game (Game): The game to simulate, which must support `undo()`.
+        rng (random.Random | None): The generator of the moves, None for
+            the module `random`.
+
+    Returns:
+        float: The points of the finished game.
+    """
+    choice = random.choice if rng is None else rng.choice
+    depth = 0
+    while not game.finished:
+        game.do(choice(game.rollout_moves))
+        depth += 1
+
+    score = game.points
+
+    for _ in range(depth):
+        game.undo()
+
+    return score
+
+def simulate_batch(game: Game, n: int,
+                   rng: random.Random | None = None) -> npt.NDArray[np.float64]:
+    """
+    Play `n` random rollouts from the current state, and return their points.
+
+    Uses the vectorized `random_playouts(n)` of the game if it has one, and
+    otherwise plays the rollouts one by one with `simulate`.
+
+    Args:
+        game (Game): The game to simulate.
+        n (int): The number of rollouts.
+        rng (random.Random | None): The generator of the moves of rollouts
+            played one by one, None for the module `random`.
+
+    Returns:
+        npt.NDArray[np.float64]: The points of every rollout.
+    """
+    playouts = getattr(game, "random_playouts", None)
+    if playouts is not None:
+        return playouts(n)
+
+    return np.array([simulate(game, rng) for _ in range(n)])
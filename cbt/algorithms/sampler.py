@@ -0,0 +1,95 @@
+"""
+This module implements the sampling of arms from the distributions of the bandits.
+
+`Generator.choice` validates the probabilities and builds their cumulative
+distribution on every call, although the distribution of a node only changes
+when the node is updated. `ArmSampler` caches the cumulative distribution of a
+node in its `cdf` slot, which the bandits clear whenever they change `p`, and
+draws the uniform random numbers in blocks. A node with a one-hot `p` (its
+`arm` is set) returns its arm without drawing a number at all.
+
+For a distribution that is not one-hot, the sampler draws the same arms from
+the same random numbers as `Generator.choice`. The cumulative distribution of
+at most `small_k` probabilities is built in pure Python, which gives the same
+sums as `np.cumsum` without its call overhead.
+
+Classes:
+    ArmSampler: Samples the index of a child from the distribution of a node.
+"""
+
+from __future__ import annotations
+from bisect import bisect_right
+from itertools import accumulate
+
+import numpy as np
+import numpy.typing as npt
+
+from cbt.algorithms.node import CBTNode
+from cbt.algorithms.small import SMALL_K
+
+class ArmSampler:
+    """
+    Samples arms from the distributions `p` of the nodes, with a cached
+    cumulative distribution per node and blocks of `block_size` uniform
+    random numbers from `rng`.
+    """
+    rng: np.random.Generator
+    block_size: int
+    small_k: int
+    _uniforms: list[float]
+
+    def __init__(self, rng: np.random.Generator | None = None, block_size: int = 1024,
+                 small_k: int = SMALL_K) -> None:
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.block_size = block_size
+        self.small_k = small_k
+        self._uniforms = []
+
+    def sample(self, node: CBTNode) -> int:
+        """
+        Return the index of a child of the node, drawn from `node.p`.
+
+        Raises:
+            ValueError: If `node.p` has negative (or NaN) probabilities.
+        """
+        if node.arm >= 0:
+            return node.arm
+
+        cdf = node.cdf
+        if cdf is None:
+            cdf = node.cdf = self.cdf(node.p, self.small_k)
+        return bisect_right(cdf, self.uniform())
+
+    def uniform(self) -> float:
+        """
+        Return the next uniform random number, drawing a new block if needed.
+        """
+        if not self._uniforms:
+            # Reversed, so popping from the end returns the numbers in the
+            # order the generator drew them.
+            self._uniforms = self.rng.random(self.block_size)[::-1].tolist()
+        return self._uniforms.pop()
+
+    @staticmethod
+    def cdf(p: npt.NDArray[np.float64], small_k: int = SMALL_K) -> list[float]:
+        """
+        Return the cumulative distribution of `p`, normalized like `Generator.choice` does.
+
+        Raises:
+            ValueError: If `p` has negative (or NaN) probabilities.
+        """
+        if len(p) <= small_k:
+            probabilities = p.tolist()
+            # Also catches NaN, which is not non-negative either.
+            if not all(value >= 0 for value in probabilities):
+                raise ValueError("probabilities are not non-negative")
+            cumulative = list(accumulate(probabilities))
+            total = cumulative[-1]
+            return [value / total for value in cumulative]
+
+        if not (p >= 0).all():
+            raise ValueError("probabilities are not non-negative")
+
+        cdf = np.cumsum(p)
+        cdf /= cdf[-1]
+        return cdf.tolist()
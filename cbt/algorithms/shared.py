@@ -0,0 +1,450 @@
+"""
+This module implements tree-parallel search: threads that grow one shared tree.
+
+Every thread runs the iterations of the search on its own copy of the game,
+with its own path, scratch buffers and random numbers (a `random.Random` for
+the expanded moves and the rollouts, and the generators of the game and the
+bandit, all spawned from the seed of the search), and they share the
+nodes of one tree, the iterations and the node limit (`SharedTree`). Each
+node has a lock (`LockedMCTSNode`, `LockedCBTNode`), and a thread holds the
+lock of a node while it chooses, adds or updates the children of the node.
+A thread holds at most the lock of a node and then that of one of its
+children, so the threads cannot deadlock. That is also why the shared
+searches have no transposition table, a node has a single parent.
+
+Threads that choose at the same time would all follow the most promising
+path, so a thread that descends through a node adds a virtual loss to it,
+which it only takes back when it backpropagates the real score. In MCTS the
+virtual loss counts as `virtual_loss` visits that the player to move lost,
+in CBT2 it divides the probability of the child by 1 plus `virtual_loss`
+times the number of threads below it.
+
+The threads only run at the same time on a free-threaded Python (3.13t and
+later). With the GIL they take turns, and the shared tree only adds the cost
+of the locks to a sequential search.
+
+Constants:
+    MAX_DRAWS: The number of draws of an arm under virtual loss in CBT2.
+
+Classes:
+    SharedTree: The iterations and nodes that the threads of a search share.
+    SharedCBandit: The CBT2 bandit of one thread, with virtual loss.
+    SharedMCTS: MCTS with threads that grow one tree.
+    SharedCBT2: CBT2 with threads that grow one tree.
+
+Functions:
+    grow: Run the iterations of a search in threads.
+"""
+
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import os
+import random
+import threading
+from typing import Any, Protocol, Sequence
+
+import numpy as np
+
+from cbt.algorithms import budget
+from cbt.algorithms.CBT2 import CBT2, CBandit
+from cbt.algorithms.MCTS import EXPLORATION, MCTS
+from cbt.algorithms.node import (REWARD, VISITS, LockedCBTNode, LockedMCTSNode,
+                                 confidence_bounds)
+from cbt.algorithms.regression import DenseRegression
+from cbt.algorithms.transposition import TranspositionTable
+from cbt.game import Game
+
+MAX_DRAWS = 8
+
+class SharedTree:
+    """
+    The budget of the threads that grow one tree: the `iterations` that are
+    left, and the `nodes` in the tree, starting from those it already has,
+    at most `max_nodes` (0 means no limit).
+    """
+    iterations: int
+    max_nodes: int
+    nodes: int
+    _lock: threading.Lock
+
+    def __init__(self, iterations: int, max_nodes: int = 0, nodes: int = 0) -> None:
+        self.iterations = iterations
+        self.max_nodes = max_nodes
+        self.nodes = nodes
+        self._lock = threading.Lock()
+
+    def take_iteration(self) -> bool:
+        """
+        Take one of the iterations that are left, return False if there are none.
+        """
+        with self._lock:
+            if self.iterations <= 0:
+                return False
+            self.iterations -= 1
+            return True
+
+    def add_node(self) -> bool:
+        """
+        Count a node that is added to the tree, return False (and count
+        nothing) if the tree is full.
+        """
+        with self._lock:
+            if 0 < self.max_nodes <= self.nodes:
+                return False
+            self.nodes += 1
+            return True
+
+    def cancel(self) -> None:
+        """
+        Drop the iterations that are left, so all threads stop.
+        """
+        with self._lock:
+            self.iterations = 0
+
+class Worker(Protocol):
+    """
+    The search of one thread, which runs one iteration on the shared tree at a time.
+    """
+    def iterate(self, root: Any, tree: SharedTree) -> None: ...
+
+def grow(workers: Sequence[Worker], root: Any, tree: SharedTree,
+         stop: threading.Event | None = None, end: float | None = None) -> None:
+    """
+    Run the iterations of `tree` from `root`, every worker in its own
+    thread, until they are used up, `stop` is set or the deadline `end` (see
+    `cbt.algorithms.budget`) has passed.
+
+    Raises:
+        Exception: The first exception of a worker, after all threads stopped.
+    """
+    with ThreadPoolExecutor(len(workers)) as pool:
+        futures = [pool.submit(_grow, worker, root, tree, stop, end) for worker in workers]
+    for future in futures:
+        future.result()
+
+def _grow(worker: Worker, root: Any, tree: SharedTree,
+          stop: threading.Event | None, end: float | None) -> None:
+    """
+    Run iterations of one worker until the search stops.
+    """
+    i = 0
+    try:
+        while not (stop is not None and stop.is_set() or budget.expired(i, end)) \
+                and tree.take_iteration():
+            worker.iterate(root, tree)
+            i += 1
+    except BaseException:
+        tree.cancel()
+        raise
+
+def _threads(threads: int | None, virtual_loss: float,
+             table: TranspositionTable | None) -> int:
+    """
+    Return the number of threads of a shared search, one per core by default.
+
+    Raises:
+        ValueError: If there are no threads, the virtual loss is not
+            positive, or the search has transpositions.
+    """
+    threads = threads if threads is not None else os.cpu_count() or 1
+    if threads < 1:
+        raise ValueError("A shared search needs at least one thread")
+    # A child that was just added has no visits but the virtual loss.
+    if virtual_loss <= 0:
+        raise ValueError("The virtual loss must be positive")
+    if table is not None:
+        raise ValueError("A shared search has no transpositions")
+    return threads
+
+def _streams(seeds: np.random.SeedSequence, n: int) -> list[int]:
+    """
+    Return `n` different seeds from the stream of a thread.
+    """
+    return seeds.generate_state(n).tolist()
+
+def _loss(game: Game) -> float:
+    """
+    Return the points of a loss for the player to move, the points are
+    between 0 and 1 from the perspective of the first player.
+    """
+    return 0.0 if game.player == 0 else 1.0
+
+class SharedMCTS(MCTS):
+    """
+    MCTS with `threads` threads that grow one tree.
+
+    `iters` counts the iterations of all threads together. The other
+    options are those of `MCTS`, except for transpositions.
+    """
+    node_type = LockedMCTSNode
+    rng: random.Random
+    threads: int
+    virtual_loss: float
+    _seeds: np.random.SeedSequence
+
+    def __init__(self, game: Game, threads: int | None = None,
+                 virtual_loss: float = 1.0, **options: Any) -> None:
+        super().__init__(game, **options)
+        self.threads = _threads(threads, virtual_loss, self.table)
+        self.virtual_loss = virtual_loss
+        self._seeds = np.random.SeedSequence()
+
+    def seed(self, seed: int) -> None:
+        """
+        Seed the random numbers of the search and those of its threads, each
+        thread draws from its own streams. The threads interleave on the
+        tree, so only a search with one thread is reproducible.
+        """
+        super().seed(seed)
+        self._seeds = np.random.SeedSequence(seed)
+
+    def search(self, iters: int, stop: threading.Event | None = None,
+               end: float | None = None) -> LockedMCTSNode:
+        root = self.tree_root()
+        tree = SharedTree(iters, self.max_nodes, self.nodes)
+        grow(self.workers(), root, tree, stop, end)
+        self.nodes = tree.nodes
+        return root
+
+    def workers(self) -> list[SharedMCTS]:
+        """
+        Return a copy of the search for every thread, with its own copy of
+        the game, its own path and its own random numbers.
+        """
+        workers = []
+        for seeds in self._seeds.spawn(self.threads):
+            worker = copy.copy(self)
+            worker.b = self.b.clone()
+            game_seed, rng_seed = _streams(seeds, 2)
+            worker.b.seed(game_seed)
+            worker.rng = random.Random(rng_seed)
+            worker.path = []
+            worker.arms = []
+            workers.append(worker)
+        return workers
+
+    def iterate(self, root: LockedMCTSNode, tree: SharedTree) -> None:
+        """
+        Run one iteration of the search from `root`.
+        """
+        v = self.descend(root, tree)
+        self.backpropagate(v, self.simulate())
+
+    def descend(self, v: LockedMCTSNode, tree: SharedTree) -> LockedMCTSNode:
+        """
+        Select a path from `v` like `select`, add a child to its last node
+        like `expand`, and return the last node of the path.
+
+        Every node on the path counts its visit at once, and the statistics
+        of every child on the path count a virtual loss until `backpropagate`.
+        """
+        game = self.b
+        self.path = []
+        self.arms = []
+        expanded = False
+        while True:
+            with v.lock:
+                v.n += 1
+                self.path.append(v)
+                if expanded or game.finished:
+                    return v
+
+                missing = self.missing_moves(v)
+                if missing:
+                    if not tree.add_node():
+                        return v
+                    move = self.rng.choice(missing)
+                    child = v.add_child(move)
+                    idx = child.index
+                    expanded = True
+                else:
+                    sign = 1.0 if game.player == 0 else -1.0
+                    idx = int(np.argmax(confidence_bounds(v, len(v.children), EXPLORATION, sign)))
+                    move = v.child_moves[idx]
+                    child = v.children[idx]
+
+                stats = v.child_stats
+                stats[VISITS, idx] += self.virtual_loss
+                stats[REWARD, idx] += self.virtual_loss * _loss(game)
+
+            game.do(move)
+            self.arms.append(idx)
+            v = child
+
+    def backpropagate(self, v: LockedMCTSNode, score: float) -> None:
+        """
+        Add `score` to the nodes along the path of the last descent, and
+        replace the virtual losses by it.
+        """
+        if self.path[-1] is not v:
+            raise RuntimeError("Can only backpropagate from the last selected node")
+
+        for depth in range(len(self.path)-1, -1, -1):
+            node = self.path[depth]
+            with node.lock:
+                node.r = node.r + score
+                if depth < len(self.arms):
+                    idx = self.arms[depth]
+                    stats = node.child_stats
+                    stats[VISITS, idx] += 1 - self.virtual_loss
+                    stats[REWARD, idx] += score - self.virtual_loss * _loss(self.b)
+
+            if depth > 0:
+                self.b.undo()
+
+class SharedCBandit(CBandit):
+    """
+    The bandit of one thread of `SharedCBT2`: reads the values of the
+    children under their locks, and draws arms with virtual loss.
+    """
+    virtual_loss: float
+
+    def __init__(self, nu: float, gamma: float, regression: DenseRegression,
+                 small_k: int, virtual_loss: float) -> None:
+        super().__init__(nu, gamma, regression, small_k)
+        self.virtual_loss = virtual_loss
+
+    def choose_index(self, v: LockedCBTNode) -> int:
+        """
+        Sample the index of a child from `p`, weighted by 1 / (1 +
+        `virtual_loss` times the threads pending below the child).
+
+        The weights are applied by drawing again (with probability 1 minus
+        the weight), up to `MAX_DRAWS` times.
+        """
+        idx = self.sampler.sample(v)
+        for _ in range(MAX_DRAWS - 1):
+            pending = v.children[idx].pending
+            if not pending or self.sampler.uniform() * (1 + self.virtual_loss * pending) < 1:
+                break
+            idx = self.sampler.sample(v)
+        return idx
+
+    def value(self, node: LockedCBTNode) -> float:
+        with node.lock:
+            return super().value(node)
+
+class SharedCBT2(CBT2):
+    """
+    CBT2 with `threads` threads that grow one tree.
+
+    `iters` counts the iterations of all threads together. The other
+    options are those of `CBT2`, except for transpositions.
+    """
+    node_type = LockedCBTNode
+    rng: random.Random
+    threads: int
+    virtual_loss: float
+    _seeds: np.random.SeedSequence
+
+    def __init__(self, game: Game, threads: int | None = None,
+                 virtual_loss: float = 1.0, **options: Any) -> None:
+        super().__init__(game, **options)
+        self.threads = _threads(threads, virtual_loss, self.table)
+        self.virtual_loss = virtual_loss
+        self._seeds = np.random.SeedSequence()
+
+    def seed(self, seed: int) -> None:
+        """
+        Seed the random numbers of the search and those of its threads, each
+        thread draws from its own streams. The threads interleave on the
+        tree, so only a search with one thread is reproducible.
+        """
+        super().seed(seed)
+        self._seeds = np.random.SeedSequence(seed)
+
+    def search(self, iters: int, stop: threading.Event | None = None,
+               end: float | None = None) -> LockedCBTNode:
+        root = self.tree_root()
+        tree = SharedTree(iters, self.max_nodes, self.nodes)
+        grow(self.workers(), root, tree, stop, end)
+        self.nodes = tree.nodes
+        return root
+
+    def workers(self) -> list[SharedCBT2]:
+        """
+        Return a copy of the search for every thread, with its own copy of
+        the game, its own path, its own random numbers and its own bandit,
+        which only shares the parameters.
+        """
+        bandit = self.bandit
+        workers = []
+        for seeds in self._seeds.spawn(self.threads):
+            worker = copy.copy(self)
+            worker.game = self.game.clone()
+            game_seed, rng_seed, bandit_seed = _streams(seeds, 3)
+            worker.game.seed(game_seed)
+            worker.rng = random.Random(rng_seed)
+            worker.path = []
+            worker.bandit = SharedCBandit(bandit.nu, bandit.gamma,
+                                          copy.deepcopy(bandit.regression),
+                                          bandit.small_k, self.virtual_loss)
+            worker.bandit.sampler.rng = np.random.default_rng(bandit_seed)
+            workers.append(worker)
+        return workers
+
+    def iterate(self, root: LockedCBTNode, tree: SharedTree) -> None:
+        """
+        Run one iteration of the search from `root`.
+        """
+        v = self.descend(root, tree)
+        self.backpropagate(v, self.simulate())
+
+    def descend(self, v: LockedCBTNode, tree: SharedTree) -> LockedCBTNode:
+        """
+        Select a path from `v` like `select`, add a child to its last node
+        like `expand`, and return the last node of the path.
+
+        Every child on the path counts the thread as pending until
+        `backpropagate`.
+        """
+        game = self.game
+        self.path = [v]
+        while True:
+            with v.lock:
+                if game.finished:
+                    return v
+
+                missing = self.missing_moves(v)
+                if missing:
+                    if not tree.add_node():
+                        return v
+                    move = self.rng.choice(missing)
+                    child = v.add_child(move)
+                    self.player = game.do(move)
+                    self.bandit.initialize_node(child, game)
+                    if game.finished:
+                        # Other threads can read the outcome of the child
+                        # before this thread backpropagates it.
+                        self.bandit.update_node(child, game, self.simulate(), self.player)
+                    child.pending += 1
+                    self.path.append(child)
+                    return child
+
+                idx = self.bandit.choose_index(v)
+                move = v.child_moves[idx]
+                child = v.children[idx]
+                child.pending += 1
+
+            self.player = game.do(move)
+            self.path.append(child)
+            v = child
+
+    def backpropagate(self, v: LockedCBTNode, score: float) -> None:
+        """
+        Update the bandits of the nodes along the path of the last descent,
+        from the given node to the root, and drop the pending thread.
+        """
+        if self.path[-1] is not v:
+            raise RuntimeError("Can only backpropagate from the last selected node")
+
+        for depth in range(len(self.path)-1, -1, -1):
+            node = self.path[depth]
+            with node.lock:
+                self.bandit.update_node(node, self.game, score, self.player)
+                if depth + 1 < len(self.path):
+                    self.path[depth + 1].pending -= 1
+
+            if depth > 0:
+                self.player = self.game.undo()
@@ -0,0 +1,128 @@
+"""
+This module implements the bandit math of nodes with few children in pure Python.
+
+For a node with K children, most NumPy calls of a bandit update cost about a
+microsecond of call overhead, which is more than the arithmetic itself when K
+is small (K <= 9 on the 3x3 board). The bandits therefore switch to the
+functions of this module when a node has at most `small_k` children
+(`SMALL_K` by default), see `bin/benchmarks/small_k_crossover`.
+
+The functions do the same floating point operations, in the same order, as
+the NumPy code they replace, so both paths give identical results:
+`pairwise_sum` adds like `np.sum` does, and `log` returns the values of
+`np.log`, which differ from `math.log` in the last bit for some arguments.
+The dot products of the regressions stay in NumPy, BLAS fuses their
+multiplications and additions, which Python can not reproduce.
+
+Constants:
+    SMALL_K: The default number of children up to which the bandits use this module.
+    LOG_CACHE_SIZE: The number of logarithms that `log` keeps.
+
+Functions:
+    pairwise_sum: The sum of a list of floats, as computed by `np.sum`.
+    log: The natural logarithm of an integer, as computed by `np.log`.
+    inverse_gaps: The inverse-gap weights of the CBT bandits.
+    confidence_bounds: The UCB1 values of all children of a node.
+    argmin, argmax: The first index of the smallest or largest value of a list.
+"""
+
+from __future__ import annotations
+from functools import lru_cache
+from math import sqrt
+from typing import Sequence
+
+import numpy as np
+
+from cbt.algorithms.node import BORN, REWARD, VISITS, Node
+
+SMALL_K = 16
+LOG_CACHE_SIZE = 4096
+
+# The number of values that `np.sum` adds with eight accumulators, longer
+# arrays are split in two halves.
+_BLOCK = 128
+
+def pairwise_sum(values: Sequence[float], start: int = 0, stop: int | None = None) -> float:
+    """
+    Return the sum of `values[start:stop]`, with the pairwise summation of `np.sum`.
+    """
+    if stop is None:
+        stop = len(values)
+    n = stop - start
+    if n < 8:
+        total = 0.0
+        for i in range(start, stop):
+            total += values[i]
+        return total
+
+    if n <= _BLOCK:
+        return _block_sum(values, start, stop)
+
+    half = n // 2
+    half -= half % 8
+    return pairwise_sum(values, start, start + half) + pairwise_sum(values, start + half, stop)
+
+def _block_sum(values: Sequence[float], start: int, stop: int) -> float:
+    """
+    Return the sum of 8 to `_BLOCK` values, added to eight accumulators like `np.sum` does.
+    """
+    r0, r1, r2, r3, r4, r5, r6, r7 = values[start:start + 8]
+    end = stop - (stop - start) % 8
+    for i in range(start + 8, end, 8):
+        r0 += values[i]
+        r1 += values[i + 1]
+        r2 += values[i + 2]
+        r3 += values[i + 3]
+        r4 += values[i + 4]
+        r5 += values[i + 5]
+        r6 += values[i + 6]
+        r7 += values[i + 7]
+    total = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    for i in range(end, stop):
+        total += values[i]
+    return total
+
+@lru_cache(maxsize=LOG_CACHE_SIZE)
+def log(n: int) -> float:
+    """
+    Return the natural logarithm of `n`, as computed by `np.log`.
+
+    The counts of the nodes that are being updated repeat, the recent ones
+    are cached.
+    """
+    return float(np.log(float(n)))
+
+def inverse_gaps(pi: list[float], j: int, nu: float, gamma: float,
+                 sign: float = 1.0) -> list[float]:
+    """
+    Return `1 / (nu + gamma * sign * (pi[i] - pi[j]))` for every `i`.
+    """
+    best = pi[j]
+    if sign < 0:
+        return [1 / (gamma * (best - value) + nu) for value in pi]
+    return [1 / (gamma * (value - best) + nu) for value in pi]
+
+def confidence_bounds(node: Node, k: int, exploration: float,
+                      sign: float = 1.0) -> list[float]:
+    """
+    Return `sign` times the average reward plus `exploration` times the
+    UCB1 confidence radius, for the first `k` children of the node, like
+    `cbt.algorithms.node.confidence_bounds`.
+    """
+    stats = node.child_stats[:, :k].tolist()
+    visits, reward, born = stats[VISITS], stats[REWARD], stats[BORN]
+    n = node.n
+    return [sign * r / v + exploration * sqrt(log(int(n - b)) / v)
+            for v, r, b in zip(visits, reward, born)]
+
+def argmin(values: list[float]) -> int:
+    """
+    Return the first index of the smallest value, like `np.argmin`.
+    """
+    return min(range(len(values)), key=values.__getitem__)
+
+def argmax(values: list[float]) -> int:
+    """
+    Return the first index of the largest value, like `np.argmax`.
+    """
+    return max(range(len(values)), key=values.__getitem__)
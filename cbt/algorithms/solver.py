@@ -0,0 +1,143 @@
+"""
+This module implements an exact evaluator for TicTacToe positions.
+
+For every position the solver computes two values, both in points for player 0
+(1 for a win of X, 0.5 for a draw and 0 for a win of O):
+
+- the minimax value, when both players play perfectly, and
+- the expected value, when both players play uniformly random moves (as the
+  rollouts of the search algorithms do).
+
+The positions are memoized by their canonical key, so symmetric positions and
+transpositions are only evaluated once. The game tree is traversed
+iteratively with `do()` and `undo()`, so deep boards do not hit the recursion
+limit.
+
+Classes:
+    Solver: Computes, stores and loads the exact values of positions.
+"""
+
+from __future__ import annotations
+from pathlib import Path
+
+import numpy as np
+
+from cbt.games.symmetry import canonical_key
+from cbt.games.tictactoe import Move, TicTacToe
+
+class Solver:
+    """
+    Exact minimax and random-play values of TicTacToe positions.
+    """
+    size: int
+    k: int
+    values: dict[bytes, tuple[float, float]]
+
+    def __init__(self, size: int = 3, k: int | None = None) -> None:
+        self.size = size
+        self.k = size if k is None else k
+        self.values = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def solve(self, game: TicTacToe) -> tuple[float, float]:
+        """
+        Return the minimax and the random-play expected value of the position.
+
+        All positions below the current one are evaluated and memoized. The
+        game is returned to its current state.
+
+        Raises:
+            ValueError: If the board of the game differs from the solver's.
+        """
+        if (game.size, game.k) != (self.size, self.k):
+            raise ValueError(f"Solver for {self.size}x{self.size} boards with k={self.k} "
+                             f"cannot solve a {game.size}x{game.size} board with k={game.k}")
+
+        key, value = self._lookup(game)
+        if value is not None:
+            return value
+
+        # Every frame holds: key, moves, index of the next move, best value
+        # so far, sum of expected values so far, and the player to move.
+        stack: list[list] = [[key, game.moves, 0, None, 0.0, game.player]]
+        while True:
+            frame = stack[-1]
+            key, moves, idx = frame[0], frame[1], frame[2]
+
+            if idx == len(moves):
+                value = (frame[3], frame[4] / len(moves))
+                self.values[key] = value
+                stack.pop()
+                if not stack:
+                    return value
+
+                game.undo()
+                self._add_child_value(stack[-1], value)
+                continue
+
+            frame[2] += 1
+            game.do(moves[idx])
+            child_key, value = self._lookup(game)
+            if value is None:
+                stack.append([child_key, game.moves, 0, None, 0.0, game.player])
+            else:
+                game.undo()
+                self._add_child_value(frame, value)
+
+    def value(self, game: TicTacToe) -> tuple[float, float] | None:
+        """
+        Return the memoized values of the position, or None if it is not solved.
+        """
+        return self._lookup(game)[1]
+
+    def save(self, path: str | Path) -> None:
+        """
+        Write the memoized values to a `.npz` file.
+        """
+        values = np.array(list(self.values.values()), dtype=np.float64).reshape(-1, 2)
+        np.savez(path,
+                 size=self.size,
+                 k=self.k,
+                 keys=np.array(list(self.values.keys()), dtype=f"S{self.size * self.size}"),
+                 minimax=values[:, 0],
+                 expected=values[:, 1])
+
+    @classmethod
+    def load(cls, path: str | Path) -> Solver:
+        """
+        Read a solver from a file written by `save`.
+        """
+        with np.load(path) as data:
+            solver = cls(int(data["size"]), int(data["k"]))
+            keys, minimax, expected = (np.asarray(data[name]).tolist()
+                                       for name in ["keys", "minimax", "expected"])
+        solver.values = dict(zip(keys, zip(minimax, expected)))
+        return solver
+
+    def _lookup(self, game: TicTacToe) -> tuple[bytes, tuple[float, float] | None]:
+        """
+        Return the key of the position, and its values if they are known.
+
+        Finished positions are not memoized, their values are the points.
+        """
+        if game.finished:
+            return b"", (game.points, game.points)
+
+        key = canonical_key(game)
+        return key, self.values.get(key)
+
+    @staticmethod
+    def _add_child_value(frame: list, value: tuple[float, float]) -> None:
+        """
+        Combine the values of a child position into its parent's frame.
+        """
+        best = frame[3]
+        if best is None:
+            frame[3] = value[0]
+        elif frame[5] == Move.X:
+            frame[3] = max(best, value[0])
+        else:
+            frame[3] = min(best, value[0])
+        frame[4] += value[1]
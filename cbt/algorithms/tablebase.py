@@ -0,0 +1,301 @@
+"""
+This module implements a precomputed tablebase of exact TicTacToe values.
+
+The tablebase stores, for every position with at most `max_empty` empty cells,
+three values in points for player 0 (1 for a win of X, 0.5 for a draw and 0
+for a win of O):
+
+- `MINIMAX`: the value when both players play perfectly,
+- `EXPECTED`: the expected points when both players play uniformly random
+  moves, as the rollouts do, and
+- `WIN`: the probability that X wins under random play, which is the expected
+  score of the engines that count a draw as a loss.
+
+Positions are indexed by a perfect hash: the rank of the set of empty cells,
+combined with the rank of the set of X cells among the filled cells. Both are
+ranked in colexicographic order, so every position with the right number of
+marks per player gets a unique index, and the table has no holes. The values
+are stored in one `.npy` file, which `load` maps into memory read-only, so
+worker processes share the pages of one file instead of each holding a copy.
+A tablebase of a file is pickled as its path, and loads the file again when
+it is unpickled.
+
+Constants:
+    MINIMAX, EXPECTED, WIN: The columns of the values of a position.
+
+Classes:
+    Tablebase: Builds, loads and looks up the tablebase.
+"""
+
+from __future__ import annotations
+from itertools import combinations
+from math import comb
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from cbt.game import Game
+from cbt.games.tictactoe import Move, window_array
+
+MINIMAX = 0
+EXPECTED = 1
+WIN = 2
+
+class Tablebase:
+    """
+    Exact values of all TicTacToe positions with at most `max_empty` empty cells.
+
+    The file holds a float32 array of shape (1 + positions, 3). The first row
+    holds the size, k and max_empty of the table, every other row holds the
+    `MINIMAX`, `EXPECTED` and `WIN` values of one position.
+    """
+    size: int
+    k: int
+    max_empty: int
+    values: npt.NDArray[np.float32]
+    path: Path | None
+    _offsets: list[int]
+    _binomials: list[list[int]]
+    _binomial_array: npt.NDArray[np.int64]
+
+    def __init__(self, data: npt.NDArray[np.float32], path: str | Path | None = None) -> None:
+        self.size, self.k, self.max_empty = (int(value) for value in data[0])
+        self.values = data[1:]
+        # The file the data is mapped from, if any.
+        self.path = None if path is None else Path(path)
+
+        cells = self.size * self.size
+        self._binomials = [[comb(n, m) for m in range(cells + 1)] for n in range(cells + 1)]
+        self._binomial_array = np.array(self._binomials, dtype=np.int64)
+        self._offsets = self.offsets(self.size, self.max_empty)
+        if len(self.values) != self._offsets[-1]:
+            raise ValueError(f"Tablebase has {len(self.values)} positions "
+                             f"instead of {self._offsets[-1]}")
+
+    @staticmethod
+    def offsets(size: int, max_empty: int) -> list[int]:
+        """
+        Return the first index of the positions with 0, 1, ..., `max_empty`
+        empty cells, followed by the total number of positions.
+        """
+        cells = size * size
+        offsets = [0]
+        for empty in range(max_empty + 1):
+            filled = cells - empty
+            offsets.append(offsets[-1] + comb(cells, empty) * comb(filled, (filled + 1) // 2))
+        return offsets
+
+    @classmethod
+    def build(cls, path: str | Path, size: int = 3, k: int | None = None,
+              max_empty: int | None = None, max_positions: int = 1 << 27) -> Tablebase:
+        """
+        Compute the tablebase and write it to a `.npy` file.
+
+        The positions are solved backwards, from full boards to boards with
+        `max_empty` empty cells, a whole level at a time: the values of a
+        position follow from the values of its children, which have one empty
+        cell less.
+
+        Args:
+            path (str | Path): The file to write.
+            size (int): The width (and height) of the board.
+            k (int | None): The number of marks in a row needed to win,
+                defaults to the size of the board.
+            max_empty (int | None): The largest number of empty cells of a
+                stored position, defaults to all cells.
+            max_positions (int): The largest number of positions to store.
+
+        Raises:
+            ValueError: If the table would hold more than `max_positions` positions.
+        """
+        cells = size * size
+        k = size if k is None else k
+        max_empty = cells if max_empty is None else min(max_empty, cells)
+        offsets = cls.offsets(size, max_empty)
+        if offsets[-1] > max_positions:
+            raise ValueError(f"A tablebase of {size}x{size} boards with up to {max_empty} "
+                             f"empty cells holds {offsets[-1]} positions, "
+                             f"more than {max_positions}")
+
+        data = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                         shape=(offsets[-1] + 1, 3))
+        data[0] = (size, k, max_empty)
+        tablebase = cls(data, path)
+
+        for empty in range(max_empty + 1):
+            level = tablebase.values[offsets[empty]:offsets[empty + 1]]
+            below = tablebase.values[offsets[empty - 1]:offsets[empty]] if empty else None
+            for boards in _level_boards(cells, empty):
+                level[tablebase.indices(boards) - offsets[empty]] = \
+                    tablebase._solve_boards(boards, below, offsets[empty - 1] if empty else 0)
+
+        data.flush()
+        return tablebase
+
+    @classmethod
+    def load(cls, path: str | Path) -> Tablebase:
+        """
+        Map a tablebase written by `build` into memory, without copying it.
+        """
+        return cls(np.load(path, mmap_mode="r"), path)
+
+    def __reduce__(self) -> tuple[object, tuple[object, ...]]:
+        # Send the path to the worker processes instead of a copy of the
+        # mapped data, each process maps the file itself.
+        if self.path is None:
+            data = np.concatenate(([[self.size, self.k, self.max_empty]], self.values))
+            return (type(self), (data.astype(np.float32),))
+        return (type(self).load, (self.path,))
+
+    def check(self, game: Game) -> None:
+        """
+        Raise a ValueError if the positions of `game` are not in this tablebase.
+        """
+        size, k = getattr(game, "size", None), getattr(game, "k", None)
+        if (size, k) != (self.size, self.k):
+            raise ValueError(f"Tablebase for {self.size}x{self.size} boards with k={self.k} "
+                             f"cannot evaluate {game.name}")
+
+    def index(self, game: Game) -> int | None:
+        """
+        Return the index of the current position of `game`, or None if it has
+        more than `max_empty` empty cells.
+        """
+        binomials = self._binomials
+        empty = filled = marks_x = rank_empty = rank_x = 0
+        for cell, mark in enumerate(cell for row in game.board for cell in row):
+            if mark == Move.EMPTY:
+                empty += 1
+                rank_empty += binomials[cell][empty]
+            else:
+                if mark == Move.X:
+                    marks_x += 1
+                    rank_x += binomials[filled][marks_x]
+                filled += 1
+
+        if empty > self.max_empty:
+            return None
+        return self._offsets[empty] + rank_empty * binomials[filled][(filled + 1) // 2] + rank_x
+
+    def lookup(self, game: Game) -> npt.NDArray[np.float32] | None:
+        """
+        Return the `MINIMAX`, `EXPECTED` and `WIN` values of the current
+        position of `game`, or None if it is not in the tablebase.
+        """
+        idx = self.index(game)
+        if idx is None:
+            return None
+        return self.values[idx]
+
+    def expected(self, game: Game) -> float | None:
+        """
+        Return the expected points of a random playout from the current
+        position of `game`, or None if it is not in the tablebase.
+        """
+        idx = self.index(game)
+        return None if idx is None else float(self.values[idx, EXPECTED])
+
+    def win_probability(self, game: Game) -> float | None:
+        """
+        Return the probability that X wins a random playout from the current
+        position of `game`, or None if it is not in the tablebase.
+        """
+        idx = self.index(game)
+        return None if idx is None else float(self.values[idx, WIN])
+
+    def indices(self, boards: npt.NDArray[np.int8]) -> npt.NDArray[np.int64]:
+        """
+        Return the indices of a batch of flat boards, with the same number of
+        empty cells each, see `index`.
+        """
+        cells = self.size * self.size
+        binomials = self._binomial_array
+        columns = np.arange(cells)
+
+        empty = boards == Move.EMPTY
+        rank_empty = np.where(empty, binomials[columns, np.cumsum(empty, axis=1)], 0).sum(axis=1)
+
+        filled = ~empty
+        marks_x = boards == Move.X
+        positions = np.cumsum(filled, axis=1) - 1
+        rank_x = np.where(marks_x, binomials[positions, np.cumsum(marks_x, axis=1)], 0).sum(axis=1)
+
+        n_empty = int(empty[0].sum()) if len(boards) else 0
+        n_filled = cells - n_empty
+        return (self._offsets[n_empty]
+                + rank_empty * self._binomials[n_filled][(n_filled + 1) // 2]
+                + rank_x)
+
+    def _solve_boards(self, boards: npt.NDArray[np.int8],
+                      below: npt.NDArray[np.float32] | None,
+                      offset: int) -> npt.NDArray[np.float32]:
+        """
+        Return the values of a batch of boards, given the values of all
+        positions with one empty cell less (`below`, starting at index `offset`).
+        """
+        owners = boards[:, window_array(self.size, self.k)]
+        won_x = (owners == Move.X).all(axis=2).any(axis=1)
+        won_o = (owners == Move.O).all(axis=2).any(axis=1)
+
+        values = np.empty((len(boards), 3), dtype=np.float32)
+        values[:, MINIMAX] = np.where(won_x, 1.0, np.where(won_o, 0.0, 0.5))
+        values[:, EXPECTED] = values[:, MINIMAX]
+        values[:, WIN] = won_x
+
+        n_empty = int((boards[0] == Move.EMPTY).sum())
+        open_boards = ~(won_x | won_o)
+        if below is None or n_empty == 0 or not open_boards.any():
+            return values
+
+        parents = boards[open_boards]
+        player = Move.X if (parents[0] != Move.EMPTY).sum() % 2 == 0 else Move.O
+        children = _children(parents, n_empty, player)
+        child_values = below[self.indices(children) - offset].reshape(len(parents), n_empty, 3)
+        best = np.max if player == Move.X else np.min
+        values[open_boards, MINIMAX] = best(child_values[:, :, MINIMAX], axis=1)
+        values[open_boards, EXPECTED] = child_values[:, :, EXPECTED].mean(axis=1)
+        values[open_boards, WIN] = child_values[:, :, WIN].mean(axis=1)
+        return values
+
+def _children(parents: npt.NDArray[np.int8], n_empty: int,
+              player: Move) -> npt.NDArray[np.int8]:
+    """
+    Return the children of a batch of boards with `n_empty` empty cells each:
+    for every board, `player` plays each of its empty cells in turn.
+    """
+    _, empty_cells = np.nonzero(parents == Move.EMPTY)
+    children = np.repeat(parents, n_empty, axis=0)
+    children[np.arange(len(children)), empty_cells] = player
+    return children
+
+def _level_boards(cells: int, empty: int, batch: int = 1 << 16):
+    """
+    Yield all flat boards with `empty` empty cells, in batches of about `batch` boards.
+
+    X has played the first move, so X has as many marks as O, or one more.
+    """
+    filled = cells - empty
+    empty_sets = _combinations(cells, empty)
+    x_sets = _combinations(filled, (filled + 1) // 2)
+
+    per_batch = max(1, batch // len(x_sets))
+    for start in range(0, len(empty_sets), per_batch):
+        empties = empty_sets[start:start + per_batch]
+        is_empty = np.zeros((len(empties), cells), dtype=bool)
+        is_empty[np.arange(len(empties))[:, None], empties] = True
+        filled_cells = np.nonzero(~is_empty)[1].reshape(len(empties), filled)
+
+        boards = np.where(is_empty, np.int8(Move.EMPTY), np.int8(Move.O))
+        boards = np.repeat(boards[:, None, :], len(x_sets), axis=1)
+        rows = np.arange(len(empties))[:, None, None]
+        boards[rows, np.arange(len(x_sets))[None, :, None], filled_cells[:, x_sets]] = Move.X
+        yield boards.reshape(-1, cells)
+
+def _combinations(n: int, m: int) -> npt.NDArray[np.intp]:
+    """
+    Return all subsets of `m` out of `n` elements, as an array of shape (C(n, m), m).
+    """
+    if m == 0:
+        return np.zeros((1, 0), dtype=np.intp)
+    return np.array(list(combinations(range(n), m)), dtype=np.intp).reshape(-1, m)
@@ -0,0 +1,62 @@
+"""
+This module implements a bounded transposition table for the tree searches.
+
+Games like TicTacToe reach the same position through different move orders.
+The search algorithms store the node of every position they expand in the
+table, keyed by `Game.state_key`, and link an existing node as a child instead
+of creating a new one when a position is reached again. All statistics stored
+on the node (including bandit state) are then shared between the paths.
+
+Classes:
+    TranspositionTable: A least recently used map from state keys to nodes.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+N = TypeVar("N")
+
+class TranspositionTable(Generic[N]):
+    """
+    Map from state keys to tree nodes, holding at most `max_size` entries.
+
+    When the table is full, the least recently used entry is evicted. An
+    evicted node stays in the tree, it can just no longer be shared.
+    """
+    max_size: int
+    _nodes: OrderedDict[int, N]
+
+    def __init__(self, max_size: int = 100000) -> None:
+        if max_size < 1:
+            raise ValueError("A transposition table must hold at least one entry")
+
+        self.max_size = max_size
+        self._nodes = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def get(self, key: int) -> N | None:
+        """
+        Return the node stored for `key`, or None if there is none.
+        """
+        node = self._nodes.get(key)
+        if node is not None:
+            self._nodes.move_to_end(key)
+        return node
+
+    def put(self, key: int, node: N) -> None:
+        """
+        Store the node for `key`, evicting the least recently used entry if needed.
+        """
+        self._nodes[key] = node
+        self._nodes.move_to_end(key)
+        if len(self._nodes) > self.max_size:
+            self._nodes.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove all entries from the table.
+        """
+        self._nodes.clear()
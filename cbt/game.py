@@ -1,4 +1,6 @@
+from __future__ import annotations
 from abc import ABC, abstractmethod
+import copy
 
 class Game(ABC):
     """
@@ -35,6 +37,13 @@ class Game(ABC):
         """
         raise NotImplementedError()
 
+    @property
+    def rollout_moves(self) -> list[int]:
+        """
+        Return the moves a random rollout chooses from, by default all `moves`.
+        """
+        return self.moves
+
     @property
     @abstractmethod
     def points(self) -> float:
@@ -60,6 +69,58 @@ class Game(ABC):
     def winner(self) -> int:
         raise NotImplementedError()
 
+    @property
+    def state_key(self) -> int | None:
+        """
+        Return a hash of the current state, or None if the game has none.
+
+        Equal states must have equal keys, so search algorithms can use the
+        key to recognize transpositions.
+        """
+        return None
+
+    def seed(self, seed: int | None = None) -> None:
+        """
+        Seed the random numbers that the game draws itself (for its payoffs
+        or for batches of playouts), so that copies of a game in different
+        processes draw different numbers. The default game draws none.
+        """
+
+    def clone(self) -> Game:
+        """
+        Return an independent copy of the current game state.
+
+        The default implementation makes a deep copy, games should override
+        this with a cheaper copy of only their mutable state.
+        """
+        return copy.deepcopy(self)
+
+    def symmetric(self) -> Game:
+        """
+        Return a view of the game that only offers one move of every set of
+        symmetric moves, for the `symmetry` option of the players.
+
+        Raises:
+            RuntimeError: If the game has no symmetry reduction.
+        """
+        raise RuntimeError(f"{self.name} has no symmetry reduction")
+
+    def real_move(self, move: int) -> int:
+        """
+        Return `move` of this game as a move of the game it is a view of (see
+        `symmetric`), in the current position. A game that is no view
+        returns the move itself.
+        """
+        return move
+
+    def played_move(self, move: int) -> int:
+        """
+        Return `move`, which was just played on the game this game is a view
+        of, as a move of this game in the position before it. A game that is
+        no view returns the move itself.
+        """
+        return move
+
     @abstractmethod
     def reset(self) -> None:
         """
@@ -2,6 +2,7 @@
 This module defines the GameManager class.
 """
 
+import time
 from typing import final
 from cbt.game import Game
 from cbt.player import Player
@@ -15,12 +16,15 @@ class GameManager:
     """
     players: tuple[Player, ...]
     game: Game
+    time_control: float | None
+    clocks: list[float]
 
     # Public methods
     def __init__(self, game: Game,
                  *players: Player,
                  print_flag: bool = False,
-                 data_flag: bool = False
+                 data_flag: bool = False,
+                 time_control: float | None = None
                  ):
         """
         Initialize the game manager with a game, players and flags.
@@ -30,11 +34,16 @@ class GameManager:
             players (tuple[Player]): The player algorithms, using a strategy pattern.
             print_flag (bool): Flag to control printing of game state.
             data_flag (bool): Flag to control printing of data later analysis.
+            time_control (float | None): The seconds every player has for
+                all its moves of a game, see `move_time`. None lets the
+                players use their own limits.
         """
         self.game = game
         self.set_players(players)
         self.print_flag = print_flag
         self.data_flag = data_flag
+        self.time_control = time_control
+        self.clocks = []
 
     def __str__(self) -> str:
         """
@@ -80,24 +89,57 @@ class GameManager:
         Run the game until it finishes.
 
         Ask the next players algorithm to choose a move and then update the
-        game state, and repeat this until the game is finished.
+        game state, and repeat this until the game is finished. Every player
+        observes every move after it is played, see `Player.observe_move`.
+
+        With a time control, every player gets its `time_per_move` from
+        `move_time` before each of its moves, and the time it took is taken
+        from its clock. A player that runs out of time is not forfeited, it
+        gets no time for its next moves (so its searches do a single
+        iteration) and its clock goes negative.
 
         Returns:
             int: The index of the winning player.
         """
         next_player = 0
         self.game.reset()
+        if self.time_control is not None:
+            self.clocks = [self.time_control] * len(self.players)
+        own_times = [player.time_per_move for player in self.players]
+
+        try:
+            while not self.game.finished:
+                player = self.players[next_player]
+                if self.time_control is not None:
+                    player.time_per_move = self.move_time(next_player)
+
+                start = time.perf_counter()
+                new_move = player.make_move(self.game)
+                if self.time_control is not None:
+                    self.clocks[next_player] -= time.perf_counter() - start
 
-        while not self.game.finished:
-            new_move = self.players[next_player].make_move(self.game)
+                if self.print_flag:
+                    print(f"Player {next_player} chose arm {new_move}")
 
-            if self.print_flag:
-                print(f"Player {next_player} chose arm {new_move}")
+                next_player = self.game.do(new_move)
 
-            next_player = self.game.do(new_move)
+                for observer in self.players:
+                    observer.observe_move(self.game, new_move)
+        finally:
+            for player, own_time in zip(self.players, own_times):
+                player.time_per_move = own_time
 
         return self.game.winner
 
+    def move_time(self, position: int) -> float:
+        """
+        Return the seconds the player at `position` gets for its next move:
+        an equal share of the time left on its clock for each of the moves
+        it may still have to make.
+        """
+        moves_left = -(-len(self.game.moves) // self.game.num_players)
+        return max(self.clocks[position], 0.0) / max(moves_left, 1)
+
     @property
     def points(self) -> float:
         """
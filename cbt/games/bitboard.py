@@ -0,0 +1,160 @@
+"""
+This module defines a bitboard implementation of TicTacToe.
+
+The board is stored as one integer bitmask per player, where bit `i` is set if
+the player has a mark on cell `i`. Wins are checked against precomputed line
+masks, and only the lines through the last played cell have to be checked, so
+`do`, `undo` and `finished` take constant time (for a fixed board size).
+
+Classes:
+    BitboardTicTacToe: A drop-in replacement for `TicTacToe`.
+"""
+
+from __future__ import annotations
+from functools import cache
+
+from cbt.games.tictactoe import Move, TicTacToe, windows
+
+@cache
+def line_masks(size: int, k: int) -> tuple[tuple[int, ...], tuple[tuple[int, ...], ...]]:
+    """
+    Return the winning line masks of a board, and the masks through every cell.
+
+    Args:
+        size (int): The width (and height) of the board.
+        k (int): The number of marks in a row needed to win.
+
+    Returns:
+        tuple: All line masks, and for every cell a tuple of the line masks
+            containing that cell.
+    """
+    lines, per_cell = windows(size, k)
+    masks = tuple(sum(1 << cell for cell in line) for line in lines)
+    return masks, tuple(tuple(masks[idx] for idx in cell) for cell in per_cell)
+
+class BitboardTicTacToe(TicTacToe):
+    """
+    TicTacToe with the board stored as one bitmask per player.
+    """
+    _masks: list[int]
+    _full: int
+    _cell_lines: tuple[tuple[int, ...], ...]
+
+    def set_board_size(self, size: int = 3, k: int | None = None) -> None:
+        self.k = size if k is None else k
+        _, self._cell_lines = line_masks(size, self.k)
+        self.size = size
+        self._masks = [0, 0]
+        self._full = (1 << (size * size)) - 1
+
+    @property
+    def board(self) -> list[list[int]]:
+        """
+        Return the board as a list of rows, like `TicTacToe.board`.
+        """
+        def cell(idx: int) -> int:
+            if self._masks[Move.X] >> idx & 1:
+                return Move.X
+            if self._masks[Move.O] >> idx & 1:
+                return Move.O
+            return Move.EMPTY
+
+        return [[cell(row * self.size + col) for col in range(self.size)]
+                for row in range(self.size)]
+
+    def do(self, move: int) -> int:
+        if move < 0 or move > self.size*self.size-1:
+            return False
+
+        bit = 1 << move
+        if (self._masks[0] | self._masks[1]) & bit:
+            return False
+
+        self._masks[self.player] |= bit
+
+        if self.print_flag:
+            self.print_board()
+
+        self.history.append(move)
+
+        self.player = 1-self.player
+        return self.player
+
+    def undo(self) -> int:
+        place = self.history.pop()
+
+        bit = 1 << place
+        if not self._masks[1-self.player] & bit:
+            raise RuntimeError("Cannot undo an empty move")
+
+        self._masks[1-self.player] &= ~bit
+
+        self.player = 1-self.player
+        return self.player
+
+    @property
+    def moves(self) -> list[int]:
+        free = self._full & ~(self._masks[0] | self._masks[1])
+        moves: list[int] = []
+        while free:
+            low = free & -free
+            moves.append(low.bit_length() - 1)
+            free ^= low
+        return moves
+
+    @property
+    def finished(self) -> bool:
+        if not self.history:
+            return False
+
+        # Only the player that made the last move can have completed a line,
+        # and that line has to go through the last move.
+        last_player = 1-self.player
+        mask = self._masks[last_player]
+        for line in self._cell_lines[self.history[-1]]:
+            if mask & line == line:
+                self._winner = Move(last_player)
+                return True
+
+        if self._masks[0] | self._masks[1] == self._full:
+            self._winner = Move.EMPTY
+            return True
+        return False
+
+    @property
+    def state_key(self) -> int:
+        """
+        Return the board as one integer, with the marks of O above those of X.
+        """
+        return self._masks[0] | self._masks[1] << (self.size * self.size)
+
+    def clone(self) -> BitboardTicTacToe:
+        """
+        Return a copy of the game, sharing only the immutable line masks.
+        """
+        # pylint: disable=protected-access
+        new = self.__class__.__new__(self.__class__)
+        new.print_flag = self.print_flag
+        new.size = self.size
+        new.k = self.k
+        new.history = self.history.copy()
+        new.player = self.player
+        new._winner = self._winner
+        new._masks = self._masks.copy()
+        new._full = self._full
+        new._cell_lines = self._cell_lines
+        # A seeded game gives the copy a generator spawned from its own, so
+        # the copy is reproducible but draws other numbers. Unseeded games
+        # share the generator of the class.
+        if "rng" in self.__dict__:
+            new.rng = self.rng.spawn(1)[0]
+        return new
+
+    def reset(self) -> None:
+        """
+        Reset the game state to its initial state.
+        """
+        self.set_board_size(self.size, self.k)
+        self.history = []
+        self.player = 0
+        self._winner = Move.EMPTY
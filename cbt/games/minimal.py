@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import numpy as np
+import numpy.typing as npt
 from cbt.game import Game
 from cbt.player import Player
 
@@ -18,17 +19,29 @@ class HumanPlayer(Player):
             return int(input_str)
 
 class Minimal(Game):
+    """
+    A two player matrix game with Bernoulli payoffs.
+
+    Player 0 chooses a row and player 1 a column of `means`, and player 0
+    scores 1 with probability `means[row, column]`. The uniform random numbers
+    for the payoffs are drawn in blocks of `block_size`, so scoring a single
+    game does not need a call into NumPy.
+    """
     means: np.ndarray
     rng: np.random.Generator = np.random.default_rng()
     choices: list[int | None]
     score: int | None
+    block_size: int
+    _uniforms: list[float]
 
-    def __init__(self, means: np.ndarray, print_flag = False):
+    def __init__(self, means: np.ndarray, print_flag = False, block_size: int = 1024):
         super().__init__(print_flag)
         self.means = means
         self.choices = [None, None]
         self.score = None
         self.player = 0
+        self.block_size = block_size
+        self._uniforms = []
 
         if self.print_flag:
             self.print_means()
@@ -70,8 +83,41 @@ class Minimal(Game):
             raise ValueError("No moves to undo")
 
         self.choices[self.player] = None
+        # The score belongs to the finished game, so it has to be sampled
+        # again the next time the game finishes.
+        self.score = None
         return self.player
 
+    def clone(self) -> Minimal:
+        """
+        Return a copy of the game, sharing the (read-only) means array.
+        """
+        # pylint: disable=protected-access
+        new = self.__class__.__new__(self.__class__)
+        new.print_flag = self.print_flag
+        new.means = self.means
+        new.choices = self.choices.copy()
+        new.score = self.score
+        new.player = self.player
+        # The copy starts a block of its own, sharing the block would
+        # correlate the payoffs of both games.
+        new.block_size = self.block_size
+        new._uniforms = []
+        # A seeded game gives the copy a generator spawned from its own, so
+        # the copy is reproducible but draws other numbers. Unseeded games
+        # share the generator of the class.
+        if "rng" in self.__dict__:
+            new.rng = self.rng.spawn(1)[0]
+        return new
+
+    def seed(self, seed: int | None = None) -> None:
+        """
+        Give the game its own generator for the payoffs, and drop the block
+        of numbers drawn by the old one.
+        """
+        self.rng = np.random.default_rng(seed)
+        self._uniforms = []
+
     def reset(self) -> None:
         self.choices = [None, None]
         self.player = 0
@@ -86,18 +132,69 @@ class Minimal(Game):
         if self.score is None:
             # Safely calculate the score using the means array
             try:
-                self.score = int(
-                    self.rng.binomial(1, self.means[tuple(self.choices)])
-                )
+                self.score = int(self._uniform() < self.means[tuple(self.choices)])
             except IndexError as exc:
                 raise ValueError(f"Invalid choices for score calculation: {self.choices}") from exc
 
         return self.score
 
+    def payoffs(self,
+                rows: int | npt.NDArray[np.intp],
+                columns: int | npt.NDArray[np.intp],
+                n: int | None = None) -> npt.NDArray[np.int64]:
+        """
+        Sample Bernoulli payoffs for (vectors of) choices in one call.
+
+        Args:
+            rows (int | npt.NDArray[np.intp]): The choices of player 0.
+            columns (int | npt.NDArray[np.intp]): The choices of player 1.
+            n (int | None): The number of payoffs to draw for a single
+                (row, column) choice. If None, one payoff is drawn for every
+                pair in the broadcast of `rows` and `columns`.
+
+        Returns:
+            npt.NDArray[np.int64]: The payoffs (0 or 1) for player 0.
+        """
+        return self.rng.binomial(1, self.means[rows, columns], size=n)
+
+    def random_playouts(self, n: int) -> npt.NDArray[np.float64]:
+        """
+        Play `n` random playouts from the current state at once, and return their points.
+
+        The players that still have to choose pick uniformly random moves.
+
+        Args:
+            n (int): The number of playouts.
+
+        Returns:
+            npt.NDArray[np.float64]: The points of every playout.
+        """
+        rows, columns = [
+            self.rng.integers(self.means.shape[player], size=n) if choice is None
+            else np.full(n, choice)
+            for player, choice in enumerate(self.choices)
+        ]
+        return self.payoffs(rows, columns).astype(np.float64)
+
+    def _uniform(self) -> float:
+        """
+        Return the next uniform random number, drawing a new block if needed.
+        """
+        if not self._uniforms:
+            self._uniforms = self.rng.random(self.block_size).tolist()
+        return self._uniforms.pop()
+
     @property
     def moves(self) -> list[int]:
+        if self.finished:
+            return []
         return list(range(self.means.shape[self.player]))
 
+    @property
+    def state_key(self) -> int:
+        row, column = (-1 if choice is None else choice for choice in self.choices)
+        return (row + 1) * (self.means.shape[1] + 1) + column + 1
+
     @property
     def name(self) -> str:
         return "Minimal Game"
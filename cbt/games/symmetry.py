@@ -0,0 +1,288 @@
+"""
+This module implements the symmetries of the (square) TicTacToe board.
+
+A square board has 8 symmetries: 4 rotations, each optionally mirrored.
+Symmetric positions have the same value, so a search only has to consider one
+of them: `SymmetricGame` shows every position in its canonical orientation,
+with a state key that is equal for all symmetric positions, so transposition
+tables and re-rooted trees share the statistics of symmetric positions. Moves
+that are mapped onto each other by a symmetry of the current position lead to
+the same position, so it only offers one of them.
+
+Functions:
+    dihedral_permutations: The symmetries of a board as permutations of its cells.
+    symmetric_keys: The Zobrist keys of the images of a board under the symmetries.
+    canonical_key: A key that is equal for all symmetric positions.
+
+Classes:
+    SymmetricGame: A TicTacToe view of the canonical orientation of every position.
+"""
+
+from __future__ import annotations
+from functools import cache
+
+import numpy as np
+import numpy.typing as npt
+
+from cbt.game import Game
+from cbt.games.tictactoe import Move, TicTacToe, zobrist_keys
+
+@cache
+def dihedral_permutations(size: int) -> tuple[tuple[int, ...], ...]:
+    """
+    Return the 8 symmetries of a `size` x `size` board as permutations of its cells.
+
+    The permutation `perm` maps cell `c` to cell `perm[c]`, the first
+    permutation is the identity.
+    """
+    cells = np.arange(size * size).reshape(size, size)
+    perms: list[tuple[int, ...]] = []
+    for grid in [cells, cells.T]:
+        for rotation in range(4):
+            image = np.rot90(grid, rotation)
+            perm = [0] * (size * size)
+            for cell, target in zip(image.ravel().tolist(), range(size * size)):
+                perm[cell] = target
+            perms.append(tuple(perm))
+    return tuple(perms)
+
+def flat_board(game: TicTacToe) -> list[int]:
+    """
+    Return the board of `game` as one list of cells.
+    """
+    return [cell for row in game.board for cell in row]
+
+@cache
+def inverse_permutations(size: int) -> tuple[tuple[int, ...], ...]:
+    """
+    Return the inverses of `dihedral_permutations(size)`, in the same order.
+    """
+    inverses: list[tuple[int, ...]] = []
+    for perm in dihedral_permutations(size):
+        inverse = [0] * len(perm)
+        for cell, target in enumerate(perm):
+            inverse[target] = cell
+        inverses.append(tuple(inverse))
+    return tuple(inverses)
+
+@cache
+def compositions(size: int) -> tuple[tuple[int, ...], ...]:
+    """
+    Return the index in `dihedral_permutations(size)` of the symmetry `u`
+    applied after the symmetry `s`, as `compositions(size)[u][s]`.
+    """
+    perms = dihedral_permutations(size)
+    index = {perm: idx for idx, perm in enumerate(perms)}
+    return tuple(tuple(index[tuple(outer[cell] for cell in inner)] for inner in perms)
+                 for outer in perms)
+
+def symmetric_keys(game: TicTacToe) -> list[int]:
+    """
+    Return the Zobrist keys (see `TicTacToe.state_key`) of the images of the
+    board under `dihedral_permutations`, in the same order.
+    """
+    zobrist = zobrist_keys(game.size)
+    perms = dihedral_permutations(game.size)
+    keys = [0] * len(perms)
+    for cell, mark in enumerate(flat_board(game)):
+        if mark != Move.EMPTY:
+            cell_keys = zobrist[mark]
+            for idx, perm in enumerate(perms):
+                keys[idx] ^= cell_keys[perm[cell]]
+    return keys
+
+def canonical_key(game: TicTacToe) -> bytes:
+    """
+    Return a key of the position that is equal for all symmetric positions.
+
+    Every cell is encoded as one byte (1 for empty, 2 for X and 3 for O), and
+    the key is the smallest encoding over all symmetries of the board.
+    """
+    cells = bytes(cell - Move.EMPTY + 1 for row in game.board for cell in row)
+    return min(bytes(map(cells.__getitem__, inverse))
+               for inverse in inverse_permutations(game.size))
+
+# The view forwards every method of `Game` and adds the translation of moves.
+class SymmetricGame(Game): # pylint: disable=too-many-public-methods
+    """
+    View on a TicTacToe game in the canonical orientation of every position.
+
+    The view keeps the Zobrist keys of the 8 images of the board, which `do`
+    and `undo` update, and shows the position in the orientation with the
+    smallest key: `moves`, `board` and the moves of `do` are in that
+    orientation, and `state_key` is that key, so it is equal for all
+    symmetric positions. `real_move` and `played_move` translate moves
+    between the view and the wrapped game. The keys are computed again when
+    the wrapped game was played on without the view.
+
+    In the first `max_plies` plies, `moves` only contains the smallest move
+    of every set of moves that a symmetry of the position maps onto each
+    other, after that symmetric moves are rare. Rollouts still choose from
+    all moves (`rollout_moves`), so their outcomes are not biased towards
+    the representatives.
+
+    All other methods are forwarded to the wrapped game.
+    """
+    base: TicTacToe
+    max_plies: int
+    _keys: list[int]
+    _synced: int | None
+
+    def __init__(self, base: TicTacToe, max_plies: int = 4):
+        super().__init__(print_flag=base.print_flag)
+        self.base = base
+        self.max_plies = max_plies
+        # The keys of the images of the board, for the wrapped game with
+        # the state key `_synced`.
+        self._keys = []
+        self._synced = None
+
+    def _frame(self) -> int:
+        """
+        Return the index of the symmetry that maps the board onto its
+        canonical orientation, after bringing the keys up to date.
+        """
+        if self.base.state_key != self._synced:
+            self._keys = symmetric_keys(self.base)
+            self._synced = self.base.state_key
+        keys = self._keys
+        return keys.index(min(keys))
+
+    def _update(self, player: int, cell: int) -> None:
+        """
+        Add or remove the mark of `player` on `cell` to the keys.
+        """
+        cell_keys = zobrist_keys(self.base.size)[player]
+        perms = dihedral_permutations(self.base.size)
+        self._keys = [key ^ cell_keys[perm[cell]] for key, perm in zip(self._keys, perms)]
+        self._synced = self.base.state_key
+
+    def setup(self, *args) -> None:
+        self.base.setup(*args)
+
+    def do(self, move: int) -> int:
+        base = self.base
+        cell = inverse_permutations(base.size)[self._frame()][move]
+        player, key = base.player, self._synced
+        result = base.do(cell)
+        if base.state_key != key:
+            self._update(player, cell)
+        return result
+
+    def undo(self) -> int:
+        base = self.base
+        self._frame()
+        cell = base.history[-1]
+        result = base.undo()
+        self._update(base.player, cell)
+        return result
+
+    def real_move(self, move: int) -> int:
+        return inverse_permutations(self.base.size)[self._frame()][move]
+
+    def played_move(self, move: int) -> int:
+        self._frame()
+        # The keys of the position before the move, whose player moved.
+        cell_keys = zobrist_keys(self.base.size)[1 - self.base.player]
+        perms = dihedral_permutations(self.base.size)
+        keys = [key ^ cell_keys[perm[move]] for key, perm in zip(self._keys, perms)]
+        return perms[keys.index(min(keys))][move]
+
+    @property
+    def moves(self) -> list[int]:
+        size = self.base.size
+        frame = self._frame()
+        perms = dihedral_permutations(size)
+        moves = sorted(perms[frame][cell] for cell in self.base.moves)
+        if len(self.base.history) >= self.max_plies:
+            return moves
+
+        # A symmetry maps the canonical board onto itself if the image of
+        # the board under it after the frame has the same key.
+        keys = self._keys
+        symmetries = [perms[idx] for idx, after in enumerate(compositions(size))
+                      if keys[after[frame]] == keys[frame]]
+        if len(symmetries) == 1:
+            return moves
+
+        return [move for move in moves
+                if all(perm[move] >= move for perm in symmetries)]
+
+    @property
+    def board(self) -> list[list[int]]:
+        """
+        Return the board in its canonical orientation.
+        """
+        size = self.base.size
+        board = flat_board(self.base)
+        canonical = [0] * len(board)
+        for cell, target in enumerate(dihedral_permutations(size)[self._frame()]):
+            canonical[target] = board[cell]
+        return [canonical[row * size:(row + 1) * size] for row in range(size)]
+
+    @property
+    def size(self) -> int:
+        return self.base.size
+
+    @property
+    def k(self) -> int:
+        return self.base.k
+
+    @property
+    def rollout_moves(self) -> list[int]:
+        perm = dihedral_permutations(self.base.size)[self._frame()]
+        return [perm[cell] for cell in self.base.moves]
+
+    @property
+    def points(self) -> float:
+        return self.base.points
+
+    @property
+    def name(self) -> str:
+        return f"Symmetric {self.base.name}"
+
+    @property
+    def num_players(self) -> int:
+        return self.base.num_players
+
+    @property
+    def finished(self) -> bool:
+        return self.base.finished
+
+    @property
+    def winner(self) -> int:
+        return self.base.winner
+
+    @property
+    def player(self) -> int:
+        """
+        Return the player to move in the wrapped game.
+        """
+        return self.base.player
+
+    @property
+    def state_key(self) -> int:
+        """
+        Return the Zobrist key of the board in its canonical orientation.
+        """
+        frame = self._frame()
+        return self._keys[frame]
+
+    def random_playouts(self, n: int) -> npt.NDArray[np.float64]:
+        """
+        Play `n` random playouts on the wrapped game, see `TicTacToe.random_playouts`.
+        """
+        return self.base.random_playouts(n)
+
+    def seed(self, seed: int | None = None) -> None:
+        self.base.seed(seed)
+
+    def clone(self) -> SymmetricGame:
+        # pylint: disable=protected-access
+        new = SymmetricGame(self.base.clone(), self.max_plies)
+        new._keys = self._keys
+        new._synced = self._synced
+        return new
+
+    def reset(self) -> None:
+        self.base.reset()
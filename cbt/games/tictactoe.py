@@ -1,12 +1,21 @@
+from __future__ import annotations
 from enum import IntEnum
-from functools import reduce
-from operator import add
+from functools import cache
 import random
+from typing import TYPE_CHECKING
+import numpy as np
+import numpy.typing as npt
+from cbt.algorithms import budget, parallel
 from cbt.algorithms.MCTS import MCTS
 from cbt.algorithms.cbt_alg import CBT
+from cbt.algorithms.node import RootStats
+from cbt.algorithms.ponder import Ponderer
 from cbt.game import Game
 from cbt.player import Player
 
+if TYPE_CHECKING:
+    from cbt.algorithms.tablebase import Tablebase
+
 class Move(IntEnum):
     EMPTY = -1
     X = 0
@@ -47,20 +56,106 @@ class HumanPlayer(Player):
             return int(input_str)
 
 class MCTSPlayer(Player):
+    """
+    A player that searches with MCTS.
+
+    With `reuse_tree` (off by default), the player keeps its search between
+    moves: it re-roots the tree on every move it observes, so the next
+    search starts with the statistics gathered under the moves that were
+    played. Otherwise every search starts with a new tree. With
+    `ponder` as well, the player keeps searching in the background after
+    its own move, until it observes the reply of the opponent.
+
+    With more than one of `workers`, the player runs a root-parallel search
+    in a pool of processes instead (see `cbt.algorithms.parallel`), which
+    starts every search with new trees.
+    """
     iterations: int
+    rollouts: int
+    transpositions: int
+    tablebase: Tablebase | None
+    reuse_tree: bool
+    ponder: bool
+    alg: MCTS | None
+    searched_game: Game | None
+    ponderer: Ponderer
+    moved: bool
+    workers: int
+    parallel: parallel.RootParallel | None
+    root_stats: RootStats | None
 
     def __init__(self, location, data_flag = False, print_flag = False):
         super().__init__(location, data_flag, print_flag)
         self.iterations = 1000
+        self.rollouts = 1
+        self.transpositions = 0
+        self.tablebase = None
+        self.reuse_tree = False
+        self.ponder = False
+        self.alg = None
+        self.searched_game = None
+        self.ponderer = Ponderer()
+        self.moved = False
+        self.workers = 1
+        self.parallel = None
+        self.root_stats = None
 
     def make_move(self, game: Game) -> int:
         if not isinstance(game, TicTacToe):
             raise RuntimeError("This player is only for TicTacToe")
 
-        alg = MCTS(game, data_flag=self.data_flag, print_flag=self.print_flag)
+        self.ponderer.stop()
+        if self.workers > 1:
+            return self.parallel_move(game)
+
+        if self.alg is None or not self.reuse_tree or self.searched_game is not game:
+            self.alg = MCTS(self.searched(game), data_flag=self.data_flag,
+                            print_flag=self.print_flag, rollouts=self.rollouts,
+                            transpositions=self.transpositions, tablebase=self.tablebase)
+            self.searched_game = game
+
+        move = self.alg.run(*budget.limits(self.iterations, self.time_per_move))
+        self.moved = True
+        return self.alg.b.real_move(move)
+
+    def observe_move(self, game: Game, move: int) -> None:
+        self.ponderer.stop()
+        if self.alg is not None and self.reuse_tree and self.searched_game is game:
+            self.alg.advance(self.alg.b.played_move(move))
+            if self.ponder and self.moved and not game.finished:
+                # Copied here, the opponent plays on the game while we ponder.
+                self.ponderer.start(self.alg, self.alg.b.clone())
+        self.moved = False
+
+    def parallel_move(self, game: TicTacToe) -> int:
+        """
+        Return the most visited move of a root-parallel search with `workers` processes.
+        """
+        if self.parallel is None or self.parallel.workers != self.workers:
+            if self.parallel is not None:
+                self.parallel.close()
+            self.parallel = parallel.RootParallel(MCTS, self.workers)
+        self.alg = None
+        searched = self.searched(game)
+        stats = self.parallel.run(
+            searched, *budget.limits(self.iterations, self.time_per_move),
+            data_flag=self.data_flag, print_flag=self.print_flag, rollouts=self.rollouts,
+            transpositions=self.transpositions, tablebase=self.tablebase)
+        self.root_stats = stats.relabeled(searched.real_move)
+        return parallel.best_move(self.root_stats)
+
+    def best_move(self, method: str = "max_n") -> int:
+        """
+        Return the most visited move of the last search.
+        """
+        if method != "max_n":
+            raise ValueError(f"Unknown method: {method}")
+        if self.alg is None:
+            if self.root_stats is None:
+                raise RuntimeError("No search to take the best move from")
+            return parallel.best_move(self.root_stats)
 
-        move = alg.run(self.iterations)
-        return move
+        return self.alg.b.real_move(self.alg.best_move())
 
 class CBTPlayer(Player):
     def make_move(self, game: Game) -> int:
@@ -72,18 +167,83 @@ class CBTPlayer(Player):
         move = alg.run()
         return move
 
+@cache
+def windows(size: int, k: int) -> tuple[tuple[tuple[int, ...], ...], tuple[tuple[int, ...], ...]]:
+    """
+    Return all winning windows of `k` cells in a row on a `size` x `size` board.
+
+    A window is a horizontal, vertical or diagonal segment of `k` consecutive
+    cells. With `k == size` these are exactly the rows, columns and diagonals.
+
+    Args:
+        size (int): The width (and height) of the board.
+        k (int): The number of marks in a row needed to win.
+
+    Returns:
+        tuple: All windows as tuples of cells, and for every cell the indices
+            of the windows containing that cell.
+    """
+    if k < 1 or k > size:
+        raise ValueError(f"k must be between 1 and the board size {size}, not {k}")
+
+    wins: list[tuple[int, ...]] = []
+    for row in range(size):
+        for col in range(size):
+            for d_row, d_col in [(0, 1), (1, 0), (1, 1), (1, -1)]:
+                end_row, end_col = row + d_row * (k-1), col + d_col * (k-1)
+                if end_row < size and 0 <= end_col < size:
+                    wins.append(tuple((row + d_row * i) * size + col + d_col * i
+                                      for i in range(k)))
+
+    per_cell = tuple(
+        tuple(idx for idx, window in enumerate(wins) if cell in window)
+        for cell in range(size * size)
+    )
+    return tuple(wins), per_cell
+
+@cache
+def zobrist_keys(size: int) -> tuple[tuple[int, ...], tuple[int, ...]]:
+    """
+    Return the random Zobrist keys of every cell, for player X and player O.
+
+    The keys are drawn from a fixed seed, so keys are equal between runs.
+    """
+    rng = np.random.default_rng(size)
+    keys = rng.integers(0, 2**63, size=(2, size * size), dtype=np.int64).tolist()
+    return tuple(keys[0]), tuple(keys[1])
+
+@cache
+def window_array(size: int, k: int) -> npt.NDArray[np.intp]:
+    """
+    Return the winning windows of `windows(size, k)` as an array of shape (windows, k).
+    """
+    return np.array(windows(size, k)[0], dtype=np.intp).reshape(-1, k)
+
 class TicTacToe(Game):
     """
     TicTacToe is a class representing the game of Tic Tac Toe.
+
+    The game is played on a `size` x `size` board, and the first player with
+    `k` marks in a row (horizontally, vertically or diagonally) wins. By
+    default `k` equals the board size, so a full line is needed. Every window
+    of `k` cells keeps a counter of the marks of each player in it, which
+    `do` and `undo` update, so `finished` does not have to scan the board.
     """
     board: list[list[int]]
     history: list[int]
     size: int
+    k: int
+    rng: np.random.Generator = np.random.default_rng()
     _winner: Move
+    _counts: list[list[int]]
+    _complete: list[int]
+    _cell_windows: tuple[tuple[int, ...], ...]
+    _zobrist: tuple[tuple[int, ...], tuple[int, ...]]
+    _key: int
 
-    def __init__(self, size: int = 3, print_flag: bool = False):
+    def __init__(self, size: int = 3, print_flag: bool = False, k: int | None = None):
         super().__init__(print_flag=print_flag)
-        self.set_board_size(size)
+        self.set_board_size(size, k)
         self.player = 0
         self.history = []
         self._winner = Move.EMPTY
@@ -91,18 +251,42 @@ class TicTacToe(Game):
     def setup(self, *args) -> None:
         pass
 
-    def set_board_size(self, size: int = 3) -> None:
+    def set_board_size(self, size: int = 3, k: int | None = None) -> None:
+        """
+        Set the size of the board and the number of marks in a row needed to win.
+
+        Args:
+            size (int): The width (and height) of the board.
+            k (int | None): The number of marks in a row needed to win,
+                defaults to the size of the board.
+
+        Raises:
+            ValueError: If `k` is not between 1 and `size`.
+        """
+        self.k = size if k is None else k
+        all_windows, self._cell_windows = windows(size, self.k)
         self.board = [[Move.EMPTY for _ in range(size)] for _ in range(size)]
         self.size = size
+        self._counts = [[0] * len(all_windows), [0] * len(all_windows)]
+        self._complete = [0, 0]
+        self._zobrist = zobrist_keys(size)
+        self._key = 0
 
     def do(self, move: int) -> int:
-        if self.board[move // self.size][move % self.size] != Move.EMPTY:
+        if move < 0 or move > self.size*self.size-1:
             return False
 
-        if move < 0 or move > self.size*self.size-1:
+        if self.board[move // self.size][move % self.size] != Move.EMPTY:
             return False
 
         self.board[move // self.size][move % self.size] = self.player
+        self._key ^= self._zobrist[self.player][move]
+
+        counts = self._counts[self.player]
+        for window in self._cell_windows[move]:
+            counts[window] += 1
+            if counts[window] == self.k:
+                self._complete[self.player] += 1
 
         if self.print_flag:
             self.print_board()
@@ -121,13 +305,22 @@ class TicTacToe(Game):
         self.board[place // self.size][place % self.size] = Move.EMPTY
 
         self.player = 1-self.player
+        self._key ^= self._zobrist[self.player][place]
+
+        counts = self._counts[self.player]
+        for window in self._cell_windows[place]:
+            if counts[window] == self.k:
+                self._complete[self.player] -= 1
+            counts[window] -= 1
+
         return self.player
 
     @property
     def moves(self) -> list[int]:
-        board_list: list[int] = reduce(add, self.board)
-        empties = list(map(lambda x: x == Move.EMPTY, board_list))
-        return [idx for idx, x in enumerate(empties) if x]
+        return [row_idx * self.size + col_idx
+                for row_idx, row in enumerate(self.board)
+                for col_idx, cell in enumerate(row)
+                if cell == Move.EMPTY]
 
     @property
     def points(self) -> float:
@@ -148,6 +341,50 @@ class TicTacToe(Game):
 
         return points
 
+    def random_playouts(self, n: int) -> npt.NDArray[np.float64]:
+        """
+        Play `n` random playouts from the current state at once, and return their points.
+
+        A random playout plays the empty cells in a uniformly random order, so
+        the playouts are drawn as random permutations of the empty cells. Every
+        window is won by the player owning all of its cells, at the time its
+        last cell is played, and the playout ends at the first won window.
+
+        Args:
+            n (int): The number of playouts.
+
+        Returns:
+            npt.NDArray[np.float64]: The points of every playout.
+        """
+        if self.finished:
+            return np.full(n, self.points)
+
+        board = np.array(self.board).ravel()
+        empty = np.flatnonzero(board == Move.EMPTY)
+
+        # The time at which every cell is played, cells that are already
+        # played get time -1.
+        times = np.full((n, board.size), -1)
+        times[:, empty] = self.rng.random((n, empty.size)).argsort(axis=1)
+
+        owners = np.broadcast_to(board, (n, board.size)).copy()
+        owners[:, empty] = (self.player + times[:, empty]) % 2
+
+        wins = window_array(self.size, self.k)
+        window_owners = owners[:, wins]
+        window_times = times[:, wins].max(axis=2)
+
+        never = board.size
+        win_times = [
+            np.where((window_owners == player).all(axis=2), window_times, never).min(axis=1)
+            for player in [Move.X, Move.O]
+        ]
+
+        points = np.full(n, 0.5)
+        points[win_times[Move.X] < win_times[Move.O]] = 1.0
+        points[win_times[Move.O] < win_times[Move.X]] = 0.0
+        return points
+
     @property
     def name(self) -> str:
         return "TicTacToe"
@@ -158,33 +395,12 @@ class TicTacToe(Game):
 
     @property
     def finished(self) -> bool:
-        # With thanks to Diapolo10
-        # (https://gist.github.com/Diapolo10/0af07b0f4c3036ad8353fbc41e1c31b1)
         for player in [Move.X, Move.O]:
-
-            # Check rows
-            for row in self.board:
-                if all(cell == player for cell in row):
-                    self._winner = player
-                    return True
-
-            # Check columns
-            for col in zip(*self.board):
-                if all(cell == player for cell in col):
-                    self._winner = player
-                    return True
-
-            # Check crosses (assumes 3x3 board)
-            diag0 = [self.board[i][i] for i in range(self.size)]
-            diag1 = [self.board[i][self.size - i - 1] for i in range(self.size)]
-            if all(cell == player for cell in diag0):
-                self._winner = player
-                return True
-            if all(cell == player for cell in diag1):
+            if self._complete[player]:
                 self._winner = player
                 return True
 
-        if all(Move.EMPTY not in row for row in self.board):
+        if len(self.history) == self.size * self.size:
             self._winner = Move.EMPTY
             return True
         return False
@@ -196,13 +412,61 @@ class TicTacToe(Game):
         """
         return self._winner.value
 
+    @property
+    def state_key(self) -> int:
+        """
+        Return the Zobrist hash of the board, which `do` and `undo` update.
+        """
+        return self._key
+
     def reset(self) -> None:
         """
         Reset the game state to its initial state.
         """
-        self.set_board_size(self.size)
+        self.set_board_size(self.size, self.k)
         self.history = []
         self.player = 0
+        self._winner = Move.EMPTY
+
+    def seed(self, seed: int | None = None) -> None:
+        """
+        Give the game its own generator for the batches of playouts.
+        """
+        self.rng = np.random.default_rng(seed)
+
+    def clone(self) -> TicTacToe:
+        """
+        Return a copy of the game, sharing only the immutable window tables.
+        """
+        # pylint: disable=protected-access
+        new = self.__class__.__new__(self.__class__)
+        new.print_flag = self.print_flag
+        new.size = self.size
+        new.k = self.k
+        new.board = [row.copy() for row in self.board]
+        new.history = self.history.copy()
+        new.player = self.player
+        new._winner = self._winner
+        new._counts = [self._counts[0].copy(), self._counts[1].copy()]
+        new._complete = self._complete.copy()
+        new._cell_windows = self._cell_windows
+        new._zobrist = self._zobrist
+        new._key = self._key
+        # A seeded game gives the copy a generator spawned from its own, so
+        # the copy is reproducible but draws other numbers. Unseeded games
+        # share the generator of the class.
+        if "rng" in self.__dict__:
+            new.rng = self.rng.spawn(1)[0]
+        return new
+
+    def symmetric(self) -> Game:
+        """
+        Return the view of the game that only offers one move of every set
+        of moves that are symmetric in the current position.
+        """
+        # Imported here, because the symmetry module imports this module.
+        from cbt.games.symmetry import SymmetricGame # pylint: disable=import-outside-toplevel
+        return SymmetricGame(self)
 
     @classmethod
     def print_empty_board(cls, size: int = 3) -> None:
@@ -5,6 +5,8 @@ from cbt.game import Game
 
 class Player(ABC):
     loc: int
+    time_per_move: float | None
+    symmetry: bool
 
     def __init__(self, location: int,
                  data_flag: bool = False,
@@ -12,6 +14,11 @@ class Player(ABC):
         self.data_flag = data_flag
         self.print_flag = print_flag
         self.loc = location
+        # Seconds a search may take for a move, instead of a number of
+        # iterations. None means the player's own limit.
+        self.time_per_move = None
+        # Search the symmetry-reduced view of the game (`Game.symmetric`).
+        self.symmetry = False
 
     @abstractmethod
     def make_move(self, game: Game) -> int:
@@ -20,3 +27,17 @@ class Player(ABC):
     @abstractmethod
     def best_move(self, method: str = "max_n") -> int:
         raise NotImplementedError()
+
+    def observe_move(self, game: Game, move: int) -> None:
+        """
+        Observe `move`, made by any player, after it is played on `game`.
+
+        Players that keep a search tree between moves re-root it here, the
+        default does nothing.
+        """
+
+    def searched(self, game: Game) -> Game:
+        """
+        Return the game to search, reduced by symmetry if `symmetry` is set.
+        """
+        return game.symmetric() if self.symmetry else game